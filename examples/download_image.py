@@ -18,19 +18,17 @@ async def upload_image(
 
     # inspect image
     image_payload = message['__payloads'][0]
-    image = await model.get_payload(image_payload)
     image_filename = f'{save_dir}/{os.path.basename(image_payload["key"])}'
     image_url = model.get_payload_url(image_payload)
 
+    # save the image
+    image_size = await model.download_to(image_payload, image_filename)
+
     # print the output image's size and URL
     print(f'image file: {image_filename}')
-    print(f'image size: {len(image)}')
+    print(f'image size: {image_size}')
     print(f'image url: {image_url}')
 
-    # save the image
-    with open(image_filename, 'wb') as f:
-        f.write(image)
-
 
 if __name__ == '__main__':
     # define command-line parameters
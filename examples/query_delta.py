@@ -15,11 +15,20 @@ if __name__ == '__main__':
         type=str,
         help='a SQL query to be executed',
     )
+    parser.add_argument(
+        '--output',
+        type=str,
+        help='a file name to store the results (.csv or .parquet)',
+    )
 
     # parse command-line parameters
     args = parser.parse_args()
     ark = OpenArk()
     models = ark.get_global_namespace()
 
-    df = models.delta_sql(args.query).collect()
-    print(df)
+    if args.output is not None:
+        models.delta_sql_sink(args.query, args.output)
+    else:
+        # NOTE: the results are streamed batch by batch
+        for df in models.delta_sql_iter(args.query):
+            print(df)
@@ -0,0 +1,34 @@
+import argparse
+import asyncio
+
+from openark import OpenArk
+
+
+async def loop_sink(ark: OpenArk, model: str, writer_id: str | None) -> None:
+    sink = await ark.get_delta_sink(model, writer_id=writer_id)
+    await sink.run()
+
+
+if __name__ == '__main__':
+    # define command-line parameters
+    parser = argparse.ArgumentParser(
+        prog='OpenARK',
+        description='OpenARK Python',
+    )
+    parser.add_argument(
+        'model',
+        type=str,
+        help='model name',
+    )
+    parser.add_argument(
+        '--writer_id',
+        type=str,
+        default=None,
+        help='a stable writer ID to resume the commit sequence after restarts',
+    )
+
+    # parse command-line parameters
+    args = parser.parse_args()
+    ark = OpenArk()
+
+    asyncio.run(loop_sink(ark, args.model, args.writer_id))
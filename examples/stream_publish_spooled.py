@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import itertools
+import os
+from pprint import pprint as print
+
+from openark import OpenArk
+
+
+# Kill and restart the NATS server while this example is running:
+# the messages are spooled on disk and drained in order after reconnecting.
+
+async def loop_publish(ark: OpenArk, model: str) -> None:
+    mc = await ark.get_model_channel(model)
+    for index in itertools.count(start=0):
+        data = {
+            'kind': 'stream_publish_spooled_example',
+            'index': index,
+        }
+        await mc.publish(data)
+        print(f'Sent: {index} (spooled: {mc.spool.size} bytes)')
+        await asyncio.sleep(0.1)  # sleep 100 ms
+
+
+if __name__ == '__main__':
+    # define command-line parameters
+    parser = argparse.ArgumentParser(
+        prog='OpenARK',
+        description='OpenARK Python',
+    )
+    parser.add_argument(
+        'model',
+        type=str,
+        help='model name',
+    )
+    parser.add_argument(
+        '--spool_dir',
+        type=str,
+        help='a directory to spool messages while disconnected',
+        default='./spool',
+    )
+
+    # parse command-line parameters
+    args = parser.parse_args()
+    os.environ['PIPE_SPOOL_DIR'] = args.spool_dir
+    ark = OpenArk()
+
+    asyncio.run(loop_publish(ark, args.model))
@@ -0,0 +1,34 @@
+import argparse
+import asyncio
+
+from openark import OpenArk
+
+
+async def loop_tail(ark: OpenArk, model: str, poll_interval: float) -> None:
+    async for rows in ark.get_model(model).tail(poll_interval=poll_interval):
+        print(rows)
+
+
+if __name__ == '__main__':
+    # define command-line parameters
+    parser = argparse.ArgumentParser(
+        prog='OpenARK',
+        description='OpenARK Python',
+    )
+    parser.add_argument(
+        'model',
+        type=str,
+        help='model name',
+    )
+    parser.add_argument(
+        '--poll_interval',
+        type=float,
+        default=1.0,
+        help='an interval to poll the new table versions in seconds',
+    )
+
+    # parse command-line parameters
+    args = parser.parse_args()
+    ark = OpenArk()
+
+    asyncio.run(loop_tail(ark, args.model, args.poll_interval))
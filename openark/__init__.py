@@ -7,21 +7,34 @@ from dotenv import load_dotenv
 import inflection
 import kubernetes as kube
 
+from openark.cache import OpenArkContentIndex, OpenArkPayloadCache, OpenArkQueryCache
+from openark.frame import OpenArkFramePublisher
 from openark.function import OpenArkFunction
 from openark.magic import OpenArkMagic
 from openark.messenger import Messenger
 from openark.messenger.nats import is_drop_allowed as is_nats_drop_allowed
-from openark.model import OpenArkGlobalNamespace, OpenArkModel, OpenArkModelChannel, get_timestamp
+from openark.model import OpenArkGlobalNamespace, OpenArkModel, OpenArkModelChannel, OpenArkPayload, get_timestamp
 from openark.network import OpenArkNetworkGraph
+from openark.recorder import OpenArkRecorder, OpenArkReplayer
+from openark.rollup import OpenArkRollup
+from openark.session import OpenArkLoopSemaphore, OpenArkSessionPool
+from openark.sink import OpenArkDeltaSink
+from openark.spool import OpenArkSpool
 
 
 __all__ = [
     'OpenArk',
+    'OpenArkDeltaSink',
+    'OpenArkFramePublisher',
     'OpenArkFunction',
     'OpenArkGlobalNamespace',
     'OpenArkModel',
     'OpenArkModelChannel',
     'OpenArkNetworkGraph',
+    'OpenArkPayload',
+    'OpenArkRecorder',
+    'OpenArkReplayer',
+    'OpenArkRollup',
     'OpenArkStream',
 ]
 
@@ -74,30 +87,56 @@ class OpenArk:
             if ipy is not None:
                 ipy.register_magics(OpenArkMagic)
 
+        self._cache = OpenArkPayloadCache.from_env()
+        self._content_index = OpenArkContentIndex.from_env()
         self._encoder = os.environ.get('PIPE_ENCODER', 'Json')
         self._global_namespace: OpenArkGlobalNamespace | None = None
+        self._index_dir = os.environ.get('PIPE_DELTA_INDEX_DIR') or None
+        self._inline_threshold = int(
+            os.environ.get('PIPE_PAYLOAD_INLINE_THRESHOLD', '0'))
+        self._lazy_payloads = os.environ.get(
+            'PIPE_LAZY_PAYLOADS', 'false').lower() == 'true'
         self._messenger: Messenger | None = None
+        self._mirror_dir = os.environ.get('PIPE_DELTA_MIRROR_DIR') or None
         self._messenger_type = os.environ.get('PIPE_DEFAULT_MESSENGER', 'Nats')
         self._namespace = 'dash' or _get_current_namespace()
+        self._namespace_lazy = os.environ.get(
+            'PIPE_NAMESPACE_LAZY', 'false').lower() == 'true'
+        self._namespace_refresh_interval = float(
+            os.environ.get('PIPE_NAMESPACE_REFRESH_INTERVAL', '0'))
+        self._namespace_workers = int(
+            os.environ.get('PIPE_NAMESPACE_WORKERS', '8'))
         self._storage_options = {
             'AWS_ACCESS_KEY_ID': os.environ['AWS_ACCESS_KEY_ID'],
             'AWS_ENDPOINT_URL': os.environ['AWS_ENDPOINT_URL'],
             'AWS_REGION': os.environ['AWS_REGION'],
             'AWS_SECRET_ACCESS_KEY': os.environ['AWS_SECRET_ACCESS_KEY'],
         }
+        self._pack_threshold = int(
+            os.environ.get('PIPE_PAYLOAD_PACK_THRESHOLD', '0'))
+        self._prefetch = int(os.environ.get('PIPE_PREFETCH', '0'))
+        self._publish_max_pending = int(
+            os.environ.get('PIPE_PUBLISH_MAX_PENDING', '64'))
+        self._publish_ordered = os.environ.get(
+            'PIPE_PUBLISH_ORDERED', 'true').lower() == 'true'
         self._persistence = os.environ.get(
             'PIPE_PERSISTENCE', 'true').lower() == 'true'
         self._persistence_metadata = os.environ.get(
             'PIPE_PERSISTENCE_METADATA', 'false').lower() == 'true'
+        self._query_cache = OpenArkQueryCache.from_env()
         self._queue_group = os.environ.get(
             'PIPE_QUEUE_GROUP', 'false').lower() == 'true'
+        self._sessions = OpenArkSessionPool.from_env()
         self._timestamp = get_timestamp()
+        self._upload_semaphore = _load_upload_semaphore()
         self._user_name = _get_user_name()
 
     def clone(self) -> 'OpenArk':
         cloned = copy(self)
         cloned.fuse_global_namespace()
         cloned.fuse_messenger()
+        cloned.fuse_sessions()
+        cloned._upload_semaphore = _load_upload_semaphore()
         return cloned
 
     @classmethod
@@ -109,6 +148,7 @@ class OpenArk:
             messenger = self._messenger
             self._messenger = None
             await messenger.close()
+        await self._sessions.close()
 
     def fuse_global_namespace(self):
         self._global_namespace = None
@@ -116,6 +156,9 @@ class OpenArk:
     def fuse_messenger(self):
         self._messenger = None
 
+    def fuse_sessions(self):
+        self._sessions = self._sessions.fork()
+
     @classmethod
     def get_global_instance(cls) -> Optional['OpenArk']:
         return cls._GLOBAL
@@ -123,19 +166,64 @@ class OpenArk:
     def get_model(self, name: str) -> OpenArkModel:
         return OpenArkModel(
             name=name,
+            cache=self._cache,
+            content_index=self._content_index,
+            index_dir=self._index_dir,
+            inline_threshold=self._inline_threshold,
+            mirror_dir=self._mirror_dir,
+            pack_threshold=self._pack_threshold,
+            sessions=self._sessions,
             storage_options=self._storage_options,
             timestamp=self._timestamp,
+            upload_semaphore=self._upload_semaphore,
             user_name=self._user_name,
         )
 
-    async def get_model_channel(self, name: str) -> OpenArkModelChannel:
+    async def get_model_channel(
+        self,
+        name: str,
+        *,
+        lazy_payloads: bool | None = None,
+        max_pending: int | None = None,
+        ordered: bool | None = None,
+        prefetch: int | None = None,
+    ) -> OpenArkModelChannel:
         return OpenArkModelChannel(
             encoder=self._encoder,
+            lazy_payloads=self._lazy_payloads
+            if lazy_payloads is None
+            else lazy_payloads,
+            max_pending=self._publish_max_pending
+            if max_pending is None
+            else max_pending,
             messenger=await self._load_messenger(),
             model=self.get_model(name),
+            ordered=self._publish_ordered if ordered is None else ordered,
+            prefetch=self._prefetch if prefetch is None else prefetch,
             queued=self._queue_group,
+            spool=OpenArkSpool.from_env(name),
         )
         
+    async def get_delta_sink(
+        self,
+        name: str,
+        **kwargs,
+    ) -> OpenArkDeltaSink:
+        return OpenArkDeltaSink(
+            channel=await self.get_model_channel(name),
+            **kwargs,
+        )
+
+    async def get_frame_publisher(
+        self,
+        name: str,
+        **kwargs,
+    ) -> OpenArkFramePublisher:
+        return OpenArkFramePublisher(
+            channel=await self.get_model_channel(name),
+            **kwargs,
+        )
+
     def get_network_graph(self) -> OpenArkNetworkGraph:
         return OpenArkNetworkGraph(
             
@@ -145,6 +233,13 @@ class OpenArk:
         if self._global_namespace is None:
             self._global_namespace = OpenArkGlobalNamespace(
                 namespace=self._namespace,
+                index_dir=self._index_dir,
+                lazy=self._namespace_lazy,
+                max_workers=self._namespace_workers,
+                mirror_dir=self._mirror_dir,
+                query_cache=self._query_cache,
+                refresh_interval=self._namespace_refresh_interval or None,
+                sessions=self._sessions,
             )
         return self._global_namespace
 
@@ -160,13 +255,19 @@ class OpenArk:
         )
 
         return OpenArkFunction(
+            cache=self._cache,
+            content_index=self._content_index,
             encoder=self._encoder,
             data=data,
+            inline_threshold=self._inline_threshold,
             messenger=await self._load_messenger(),
+            pack_threshold=self._pack_threshold,
             queued=self._queue_group,
+            sessions=self._sessions,
             storage_options=self._storage_options,
             timeout=timeout,
             timestamp=self._timestamp,
+            upload_semaphore=self._upload_semaphore,
             user_name=self._user_name,
         )
 
@@ -217,6 +318,11 @@ class OpenArk:
                 )
         return self._messenger
 
+    async def _load_messenger_local(self) -> Messenger | None:
+        from openark.messenger.local import LocalMessenger as Messenger
+
+        return Messenger()
+
     async def _load_messenger_nats(self) -> Messenger | None:
         try:
             import nats
@@ -281,6 +387,13 @@ def _get_user_name() -> str | None:
     return None
 
 
+def _load_upload_semaphore() -> OpenArkLoopSemaphore | None:
+    concurrency = int(os.environ.get('PIPE_UPLOAD_CONCURRENCY', '16'))
+    if concurrency <= 0:
+        return None
+    return OpenArkLoopSemaphore(concurrency)
+
+
 def _load_nats_token() -> str:
     token_path = os.environ['NATS_PASSWORD_PATH']
     if not os.path.exists(token_path):
@@ -0,0 +1,288 @@
+import math
+import random
+import re
+from statistics import NormalDist
+import time
+from typing import Any, Iterator
+
+import deltalake as dl
+import polars as pl
+
+from openark.delta import Aggregate, Filter, aggregate_name, filters_to_expr, get_add_actions, get_arrow_schema, prune_files
+
+_QUANTILE_PATTERN = re.compile(r'^p(\d+(?:\.\d+)?)$')
+
+
+def iter_estimates(
+    table: dl.DeltaTable,
+    aggregates: list[Aggregate],
+    filters: list[Filter] | None = None,
+    fraction: float = 0.1,
+    time_budget: float | None = None,
+    confidence: float = 0.95,
+    seed: int | None = None,
+    step: int | None = None,
+) -> Iterator[pl.DataFrame]:
+    filters = filters or []
+    expr = filters_to_expr(filters)
+    z = NormalDist().inv_cdf((1.0 + confidence) / 2.0)
+
+    # NOTE: the files are the sampling clusters
+    actions = prune_files(
+        pl.from_arrow(get_add_actions(table)),
+        get_arrow_schema(table),
+        filters,
+    )
+    sizes = dict(zip(
+        actions['path'].to_list(),
+        actions['num_records'].to_list(),
+    ))
+    dataset = table.to_pyarrow_dataset()
+    fragments = [
+        fragment
+        for fragment in dataset.get_fragments()
+        if fragment.path in sizes
+    ]
+    random.Random(seed).shuffle(fragments)
+
+    total_files = len(fragments)
+
+    # NOTE: the row counts are unknown if some files have no stats
+    total_rows = None
+    if all(sizes[fragment.path] is not None for fragment in fragments):
+        total_rows = sum(sizes[fragment.path] for fragment in fragments)
+    target_files = min(max(math.ceil(total_files * fraction), 2), total_files)
+    step = step or max(math.ceil(target_files / 4), 1)
+
+    quantile_columns = {
+        column for (func, column) in aggregates
+        if _get_quantile(func) is not None
+    }
+    columns = sorted({
+        column for (_, column) in aggregates if column != '*'
+    } | {column for (column, _, _) in filters})
+
+    clusters: list[dict[str, Any]] = []
+    values: dict[str, list[pl.Series]] = {
+        column: [] for column in quantile_columns
+    }
+    started = time.monotonic()
+    for (index, fragment) in enumerate(fragments):
+        rows = pl.from_arrow(fragment.to_table(
+            schema=dataset.schema,
+            columns=columns,
+        ))
+        if isinstance(rows, pl.Series):
+            rows = rows.to_frame()
+
+        # the rows read are counted exactly, regardless of the stats
+        cluster = {'size': rows.height}
+        if expr is not None:
+            rows = rows.filter(expr)
+        cluster['rows'] = rows.height
+        for (func, column) in aggregates:
+            if column == '*':
+                continue
+            series = rows[column].drop_nulls()
+            cluster[f'{column}.count'] = series.len()
+            if func in ('avg', 'mean', 'sum'):
+                cluster[f'{column}.sum'] = _sum(series)
+
+        # NOTE: a column is sampled once, however many aggregates read it
+        for column in values:
+            values[column].append(rows[column].drop_nulls())
+        clusters.append(cluster)
+
+        # refine the estimates progressively
+        sampled = index + 1
+        done = sampled >= target_files or (
+            time_budget is not None
+            and time.monotonic() - started >= time_budget
+        )
+        if done or sampled % step == 0:
+            yield _estimate(
+                aggregates=aggregates,
+                clusters=clusters,
+                values=values,
+                total_files=total_files,
+                total_rows=total_rows,
+                z=z,
+            )
+        if done:
+            return
+
+    if not fragments:
+        yield _estimate(aggregates, [], values, 0, 0, z)
+
+
+def _estimate(
+    aggregates: list[Aggregate],
+    clusters: list[dict[str, Any]],
+    values: dict[str, list[pl.Series]],
+    total_files: int,
+    total_rows: int | None,
+    z: float,
+) -> pl.DataFrame:
+    sampled = len(clusters)
+    exact = sampled == total_files
+    sizes = [cluster['size'] for cluster in clusters]
+
+    results = []
+    for (func, column) in aggregates:
+        name = aggregate_name(func, column)
+        match func:
+            case 'count':
+                key = 'rows' if column == '*' else f'{column}.count'
+                estimate, error = _ratio_total(
+                    [cluster[key] for cluster in clusters],
+                    sizes, total_files, total_rows,
+                )
+            case 'sum':
+                estimate, error = _ratio_total(
+                    [cluster[f'{column}.sum'] for cluster in clusters],
+                    sizes, total_files, total_rows,
+                )
+            case 'avg' | 'mean':
+                estimate, error = _ratio_mean(
+                    [cluster[f'{column}.sum'] for cluster in clusters],
+                    [cluster[f'{column}.count'] for cluster in clusters],
+                    total_files,
+                )
+            case _ if _get_quantile(func) is not None:
+                estimate, low, high = _quantile(
+                    values[column], _get_quantile(func), z, total_files,
+                )
+                if sampled < 2 and not exact:
+                    low = high = None
+                results.append(_result(
+                    name, estimate, low, high, sampled, total_files, exact,
+                ))
+                continue
+            case _:
+                raise ValueError(f'Unsupported aggregate function: {func}')
+
+        # NOTE: a single cluster tells nothing about the variance
+        if estimate is None or (sampled < 2 and not exact):
+            low = high = None
+        else:
+            margin = 0.0 if exact else z * error
+            low, high = estimate - margin, estimate + margin
+        results.append(_result(
+            name, estimate, low, high, sampled, total_files, exact,
+        ))
+    return pl.DataFrame(results, schema={
+        'aggregate': pl.String,
+        'estimate': pl.Float64,
+        'ci_low': pl.Float64,
+        'ci_high': pl.Float64,
+        'files_sampled': pl.Int64,
+        'files_total': pl.Int64,
+        'exact': pl.Boolean,
+    })
+
+
+def _get_quantile(func: str) -> float | None:
+    if func == 'median':
+        return 0.5
+    matched = _QUANTILE_PATTERN.match(func)
+    if matched is None:
+        return None
+    return float(matched.group(1)) / 100.0
+
+
+def _quantile(
+    samples: list[pl.Series],
+    quantile: float,
+    z: float,
+    total_files: int,
+) -> tuple[float | None, float | None, float | None]:
+    series = pl.concat(samples).sort() if samples else pl.Series([])
+    if series.len() == 0:
+        return None, None, None
+    estimate = series.quantile(quantile, interpolation='nearest')
+
+    # Woodruff intervals: the error of the CDF at the estimate over clusters
+    _, error = _ratio_mean(
+        [int((sample <= estimate).sum()) for sample in samples],
+        [sample.len() for sample in samples],
+        total_files,
+    )
+    return (
+        float(estimate),
+        float(series.quantile(max(quantile - z * error, 0.0), interpolation='nearest')),
+        float(series.quantile(min(quantile + z * error, 1.0), interpolation='nearest')),
+    )
+
+
+def _ratio_mean(
+    sums: list[float],
+    counts: list[int],
+    total_files: int,
+) -> tuple[float | None, float]:
+    n = len(sums)
+    if n == 0 or sum(counts) == 0:
+        return None, 0.0
+
+    ratio = sum(sums) / sum(counts)
+    mean_count = sum(counts) / n
+    variance = _residual_variance(sums, counts, ratio)
+    fpc = 1.0 - n / total_files
+    return ratio, math.sqrt(max(fpc, 0.0) * variance / n) / mean_count
+
+
+def _ratio_total(
+    totals: list[float],
+    sizes: list[int],
+    total_files: int,
+    total_rows: int | None,
+) -> tuple[float | None, float]:
+    n = len(totals)
+    if n == 0:
+        return (0.0 if total_files == 0 else None), 0.0
+    fpc = 1.0 - n / total_files
+
+    # expand by the number of files if the row counts are unknown
+    if total_rows is None:
+        mean = sum(totals) / n
+        variance = _residual_variance(totals, [1] * n, mean)
+        return total_files * mean, total_files * math.sqrt(max(fpc, 0.0) * variance / n)
+    if sum(sizes) == 0:
+        return 0.0, 0.0
+
+    # scale by the known row counts of the files
+    ratio = sum(totals) / sum(sizes)
+    variance = _residual_variance(totals, sizes, ratio)
+    return ratio * total_rows, total_files * math.sqrt(max(fpc, 0.0) * variance / n)
+
+
+def _residual_variance(ys: list[float], xs: list[float], ratio: float) -> float:
+    n = len(ys)
+    if n < 2:
+        return 0.0
+    return sum((y - ratio * x) ** 2 for (y, x) in zip(ys, xs)) / (n - 1)
+
+
+def _result(
+    name: str,
+    estimate: float | None,
+    low: float | None,
+    high: float | None,
+    sampled: int,
+    total_files: int,
+    exact: bool,
+) -> dict[str, Any]:
+    return {
+        'aggregate': name,
+        'estimate': estimate,
+        'ci_low': low,
+        'ci_high': high,
+        'files_sampled': sampled,
+        'files_total': total_files,
+        'exact': exact,
+    }
+
+
+def _sum(series: pl.Series) -> float:
+    if series.len() == 0:
+        return 0.0
+    return float(series.sum())
@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import time
+from typing import Any
+
+from openark.messenger import Messenger
+from openark.metrics import summarize_latencies
+from openark.model import OpenArkModel, OpenArkModelChannel
+
+_ALL_SUITES = ['publish', 'subscribe', 'request', 'payload']
+
+
+async def bench_publish(channel: OpenArkModelChannel, count: int) -> dict[str, Any]:
+    latencies = []
+
+    with _Measure() as measure:
+        for index in range(count):
+            sent = time.perf_counter()
+            await channel.publish({'index': index})
+            latencies.append(time.perf_counter() - sent)
+
+    return measure.summarize('publish', latencies)
+
+
+async def bench_subscribe(
+    publisher: OpenArkModelChannel,
+    subscriber: OpenArkModelChannel,
+    count: int,
+    timeout_sec: float,
+) -> dict[str, Any]:
+    latencies = []
+
+    async def consume() -> None:
+        async for message in subscriber:
+            latencies.append(time.perf_counter() - message['sent'])
+            if len(latencies) >= count:
+                break
+
+    # wait for the subscription to be established
+    consumer = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.1)
+
+    with _Measure() as measure:
+        for index in range(count):
+            await publisher.publish({
+                'index': index,
+                'sent': time.perf_counter(),
+            })
+        try:
+            await asyncio.wait_for(consumer, timeout=timeout_sec)
+        except asyncio.TimeoutError:
+            pass
+
+    result = measure.summarize('subscribe', latencies)
+    result['dropped'] = count - len(latencies)
+    return result
+
+
+async def bench_request(channel: OpenArkModelChannel, count: int) -> dict[str, Any]:
+    latencies = []
+
+    with _Measure() as measure:
+        for index in range(count):
+            sent = time.perf_counter()
+            await channel({'index': index})
+            latencies.append(time.perf_counter() - sent)
+
+    return measure.summarize('request', latencies)
+
+
+async def bench_payload(
+    channel: OpenArkModelChannel,
+    count: int,
+    size: int,
+) -> list[dict[str, Any]]:
+    data = os.urandom(size)
+
+    # upload
+    messages = []
+    latencies = []
+    with _Measure() as measure:
+        for _ in range(count):
+            sent = time.perf_counter()
+            messages.append(await channel.publish(payloads={'data': data}))
+            latencies.append(time.perf_counter() - sent)
+    upload = measure.summarize(f'payload_upload_{size}', latencies)
+
+    # download
+    latencies = []
+    with _Measure() as measure:
+        for message in messages:
+            sent = time.perf_counter()
+            await channel.get_payload(message['__payloads'][0])
+            latencies.append(time.perf_counter() - sent)
+    download = measure.summarize(f'payload_download_{size}', latencies)
+
+    for result in (upload, download):
+        result['payload_size'] = size
+        result['bytes_per_sec'] = result['msgs_per_sec'] * size
+    return [upload, download]
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    messenger = await _load_messenger(args)
+    suites = [suite.strip() for suite in args.suites.split(',')]
+
+    storage_options = _load_storage_options()
+    if storage_options is None and 'payload' in suites:
+        print('Skipping payload benchmarks: "AWS_ENDPOINT_URL" is not set',
+              file=sys.stderr)
+        suites.remove('payload')
+
+    def load_channel() -> OpenArkModelChannel:
+        return OpenArkModelChannel(
+            encoder=args.encoder,
+            messenger=messenger,
+            model=OpenArkModel(
+                name=args.model,
+                storage_options=dict(storage_options or {
+                    'AWS_ACCESS_KEY_ID': '',
+                    'AWS_ENDPOINT_URL': 'http://127.0.0.1:9000',
+                    'AWS_REGION': 'us-east-1',
+                    'AWS_SECRET_ACCESS_KEY': '',
+                }),
+            ),
+            queued=False,
+        )
+
+    results = []
+    try:
+        if 'publish' in suites:
+            results.append(await bench_publish(load_channel(), args.count))
+        if 'subscribe' in suites:
+            results.append(await bench_subscribe(
+                publisher=load_channel(),
+                subscriber=load_channel(),
+                count=args.count,
+                timeout_sec=args.timeout,
+            ))
+        if 'request' in suites:
+            await _serve_echo(messenger, args.model)
+            results.append(await bench_request(load_channel(), args.count))
+        if 'payload' in suites:
+            channel = load_channel()
+            for size in args.payload_sizes.split(','):
+                results.extend(await bench_payload(
+                    channel=channel,
+                    count=args.payload_count,
+                    size=int(size),
+                ))
+            await channel._model.close()
+    finally:
+        await messenger.close()
+
+    return {
+        'version': _get_version(),
+        'timestamp': f'{datetime.datetime.utcnow().isoformat()}Z',
+        'messenger': args.messenger,
+        'encoder': args.encoder,
+        'results': results,
+    }
+
+
+def main() -> None:
+    # define command-line parameters
+    parser = argparse.ArgumentParser(
+        prog='openark-bench',
+        description='OpenARK Python Benchmark',
+    )
+    parser.add_argument(
+        '--messenger',
+        type=str,
+        choices=['local', 'nats'],
+        default='local',
+        help='a messenger to benchmark',
+    )
+    parser.add_argument(
+        '--nats_addr',
+        type=str,
+        default='nats://127.0.0.1:4222',
+        help='a NATS server address',
+    )
+    parser.add_argument(
+        '--model',
+        type=str,
+        default='openark-bench',
+        help='a model name to be used as the topic and the bucket',
+    )
+    parser.add_argument(
+        '--encoder',
+        type=str,
+        default='Json',
+        help='a message codec',
+    )
+    parser.add_argument(
+        '--suites',
+        type=str,
+        default=','.join(_ALL_SUITES),
+        help='comma-separated benchmark suites',
+    )
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=10000,
+        help='the number of messages per suite',
+    )
+    parser.add_argument(
+        '--payload_count',
+        type=int,
+        default=20,
+        help='the number of payloads per size',
+    )
+    parser.add_argument(
+        '--payload_sizes',
+        type=str,
+        default='1024,65536,1048576,16777216',
+        help='comma-separated payload sizes in bytes',
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=30.0,
+        help='a timeout to receive the subscribed messages in seconds',
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=None,
+        help='a JSON file to store the results',
+    )
+
+    # parse command-line parameters
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(report)
+
+
+class _Measure:
+    def __enter__(self) -> '_Measure':
+        self._cpu = time.process_time()
+        self._elapsed = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._cpu = time.process_time() - self._cpu
+        self._elapsed = time.perf_counter() - self._elapsed
+
+    def summarize(self, name: str, latencies: list[float]) -> dict[str, Any]:
+        count = len(latencies)
+        return {
+            'name': name,
+            'messages': count,
+            'elapsed_sec': self._elapsed,
+            'msgs_per_sec': count / self._elapsed if self._elapsed > 0 else 0.0,
+            'cpu_us_per_msg': self._cpu / count * 1e6 if count else 0.0,
+            **summarize_latencies(latencies),
+        }
+
+
+async def _load_messenger(args: argparse.Namespace) -> Messenger:
+    match args.messenger:
+        case 'local':
+            from openark.messenger.local import LocalMessenger
+            return LocalMessenger()
+        case 'nats':
+            import nats
+            from openark.messenger.nats import NatsMessenger
+            return NatsMessenger(
+                nc=await nats.connect(servers=[args.nats_addr]),
+            )
+        case _:
+            raise ValueError(f'Unsupported messenger type: {args.messenger}')
+
+
+def _load_storage_options() -> dict[str, str] | None:
+    if 'AWS_ENDPOINT_URL' not in os.environ:
+        return None
+    return {
+        'AWS_ACCESS_KEY_ID': os.environ['AWS_ACCESS_KEY_ID'],
+        'AWS_ENDPOINT_URL': os.environ['AWS_ENDPOINT_URL'],
+        'AWS_REGION': os.environ.get('AWS_REGION', 'us-east-1'),
+        'AWS_SECRET_ACCESS_KEY': os.environ['AWS_SECRET_ACCESS_KEY'],
+    }
+
+
+async def _serve_echo(messenger: Messenger, topic: str) -> None:
+    async def echo(data: bytes) -> bytes:
+        return data
+
+    if hasattr(messenger, 'serve'):
+        messenger.serve(topic, echo)
+    else:
+        async def respond(msg) -> None:
+            await msg.respond(await echo(msg.data))
+
+        await messenger._nc.subscribe(subject=topic, cb=respond)
+
+
+def _get_version() -> str | None:
+    try:
+        from importlib.metadata import version
+        return version('openark')
+    except Exception:
+        return None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+import asyncio
+from collections import OrderedDict
+import hashlib
+import os
+import re
+import threading
+from typing import Any, Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+import polars as pl
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class LruCache(Generic[K, V]):
+    def __init__(self, /, max_weight: int) -> None:
+        self._entries: OrderedDict[K, tuple[V, int]] = OrderedDict()
+        self._max_weight = max_weight
+        self._weight = 0
+
+        self.evictions = 0
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def pop(self, key: K) -> Optional[V]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._weight -= entry[1]
+        return entry[0]
+
+    def put(self, key: K, value: V, weight: int) -> list[tuple[K, V]]:
+        # skip the values which can never fit
+        self.pop(key)
+        if weight > self._max_weight:
+            return []
+
+        self._entries[key] = (value, weight)
+        self._weight += weight
+
+        evicted = []
+        while self._weight > self._max_weight:
+            evicted_key, (evicted_value, evicted_weight) = \
+                self._entries.popitem(last=False)
+            self._weight -= evicted_weight
+            self.evictions += 1
+            evicted.append((evicted_key, evicted_value))
+        return evicted
+
+    @property
+    def max_weight(self) -> int:
+        return self._max_weight
+
+    @property
+    def weight(self) -> int:
+        return self._weight
+
+
+class OpenArkContentIndex(LruCache[tuple[str, str], str]):
+    def __init__(self, /, max_entries: int = 1 << 16) -> None:
+        super().__init__(max_weight=max_entries)
+
+    @classmethod
+    def from_env(cls) -> Optional['OpenArkContentIndex']:
+        if os.environ.get('PIPE_PAYLOAD_CONTENT_ADDRESSED', 'false').lower() != 'true':
+            return None
+
+        return cls(
+            max_entries=int(
+                os.environ.get('PIPE_PAYLOAD_CONTENT_INDEX_SIZE', str(1 << 16)),
+            ),
+        )
+
+
+class OpenArkPayloadCache:
+    def __init__(
+        self, /,
+        max_memory_bytes: int = 64 << 20,
+        disk_dir: str | None = None,
+        max_disk_bytes: int = 1 << 30,
+    ) -> None:
+        self._memory: LruCache[tuple[str, str], tuple[str, bytes]] = LruCache(
+            max_weight=max_memory_bytes,
+        )
+        self._inflight: dict[tuple[str, str], asyncio.Future] = {}
+
+        self._disk_dir = disk_dir
+        self._disk: LruCache[str, None] = LruCache(max_weight=max_disk_bytes)
+        if self._disk_dir is not None:
+            self._load_disk_index()
+
+        self._metrics = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'joined': 0,
+            'validations': 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional['OpenArkPayloadCache']:
+        max_memory_bytes = int(
+            os.environ.get('PIPE_PAYLOAD_CACHE_SIZE', str(64 << 20)),
+        )
+        disk_dir = os.environ.get('PIPE_PAYLOAD_CACHE_DIR') or None
+        if max_memory_bytes <= 0 and disk_dir is None:
+            return None
+
+        return cls(
+            max_memory_bytes=max(max_memory_bytes, 0),
+            disk_dir=disk_dir,
+            max_disk_bytes=int(
+                os.environ.get('PIPE_PAYLOAD_CACHE_DISK_SIZE', str(1 << 30)),
+            ),
+        )
+
+    async def get(
+        self,
+        model: str,
+        path: str,
+        etag: str | None,
+        fetch: Callable[[], Awaitable[tuple[str | None, bytes]]],
+        validate: Callable[[], Awaitable[str | None]],
+    ) -> bytes:
+        key = (model, path)
+
+        # revalidate the unversioned references, as the keys may be reused
+        entry = self._memory.get(key)
+        if etag is None and (entry is not None or self._disk_dir is not None):
+            self._metrics['validations'] += 1
+            etag = _normalize_etag(await validate())
+
+        # test memory tier
+        if entry is not None and etag is not None and entry[0] == etag:
+            self._metrics['memory_hits'] += 1
+            return entry[1]
+
+        # test disk tier
+        if etag is not None and self._disk_dir is not None:
+            data = await self._read_disk(key, etag)
+            if data is not None:
+                self._metrics['disk_hits'] += 1
+                self._memory.put(key, (etag, data), len(data))
+                return data
+
+        # join the in-flight fetch of the same object
+        if key in self._inflight:
+            self._metrics['joined'] += 1
+            return await asyncio.shield(self._inflight[key])
+
+        self._metrics['misses'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            fetched_etag, data = await fetch()
+            fetched_etag = _normalize_etag(fetched_etag)
+            if fetched_etag is not None:
+                self._memory.put(key, (fetched_etag, data), len(data))
+                if self._disk_dir is not None:
+                    await self._write_disk(key, fetched_etag, data)
+            future.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark the exception as retrieved when nobody has joined
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict[str, Any]:
+        hits = self._metrics['memory_hits'] + self._metrics['disk_hits']
+        requests = hits + self._metrics['misses'] + self._metrics['joined']
+        return {
+            **self._metrics,
+            'hits': hits,
+            'hit_ratio': hits / requests if requests else 0.0,
+            'memory_bytes': self._memory.weight,
+            'memory_evictions': self._memory.evictions,
+            'disk_bytes': self._disk.weight,
+            'disk_evictions': self._disk.evictions,
+        }
+
+    def _disk_path(self, key: tuple[str, str], etag: str) -> str:
+        digest = hashlib.sha256(
+            f'{key[0]}/{key[1]}@{etag}'.encode('utf-8'),
+        ).hexdigest()
+        return os.path.join(self._disk_dir, digest)
+
+    def _load_disk_index(self) -> None:
+        os.makedirs(self._disk_dir, exist_ok=True)
+
+        # restore the LRU order from the last access times
+        entries = []
+        for entry in os.scandir(self._disk_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.path, stat.st_size))
+        for (_, path, size) in sorted(entries):
+            self._evict_disk(self._disk.put(path, None, size))
+
+    async def _read_disk(self, key: tuple[str, str], etag: str) -> Optional[bytes]:
+        path = self._disk_path(key, etag)
+        if path not in self._disk:
+            return None
+        self._disk.get(path)
+        try:
+            return await asyncio.to_thread(_read_file, path)
+        except FileNotFoundError:
+            self._disk.pop(path)
+            return None
+
+    async def _write_disk(self, key: tuple[str, str], etag: str, data: bytes) -> None:
+        if len(data) > self._disk.max_weight:
+            return
+
+        path = self._disk_path(key, etag)
+        await asyncio.to_thread(_write_file, path, data)
+        self._evict_disk(self._disk.put(path, None, len(data)))
+
+    def _evict_disk(self, evicted: list[tuple[str, None]]) -> None:
+        for (path, _) in evicted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class OpenArkQueryCache:
+    def __init__(
+        self, /,
+        max_memory_bytes: int = 256 << 20,
+        disk_dir: str | None = None,
+        max_disk_bytes: int = 4 << 30,
+        spill_threshold: int = 16 << 20,
+    ) -> None:
+        self._lock = threading.Lock()
+        self._memory: LruCache[tuple[str, tuple], pl.DataFrame] = LruCache(
+            max_weight=max_memory_bytes,
+        )
+        # the latest versioned key of each query
+        self._latest: dict[str, tuple[str, tuple]] = {}
+        self._spill_threshold = spill_threshold
+
+        self._disk_dir = disk_dir
+        self._disk: LruCache[str, None] = LruCache(max_weight=max_disk_bytes)
+        if self._disk_dir is not None:
+            self._load_disk_index()
+
+        self._metrics = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional['OpenArkQueryCache']:
+        max_memory_bytes = int(
+            os.environ.get('PIPE_QUERY_CACHE_SIZE', str(256 << 20)),
+        )
+        disk_dir = os.environ.get('PIPE_QUERY_CACHE_DIR') or None
+        if max_memory_bytes <= 0 and disk_dir is None:
+            return None
+
+        return cls(
+            max_memory_bytes=max(max_memory_bytes, 0),
+            disk_dir=disk_dir,
+            max_disk_bytes=int(
+                os.environ.get('PIPE_QUERY_CACHE_DISK_SIZE', str(4 << 30)),
+            ),
+            spill_threshold=int(
+                os.environ.get('PIPE_QUERY_CACHE_SPILL_THRESHOLD', str(16 << 20)),
+            ),
+        )
+
+    def get(self, query: str, versions: dict[str, int]) -> Optional[pl.DataFrame]:
+        key = self._key(query, versions)
+        with self._lock:
+            # drop the results of the outdated table versions
+            latest = self._latest.get(key[0])
+            if latest is not None and latest != key:
+                self._invalidate(latest)
+
+            df = self._memory.get(key)
+            if df is not None:
+                self._metrics['memory_hits'] += 1
+                return df
+
+            path = self._disk_path(key)
+            if path is not None and path in self._disk:
+                self._disk.get(path)
+                try:
+                    df = pl.read_parquet(path)
+                except FileNotFoundError:
+                    self._disk.pop(path)
+                else:
+                    self._metrics['disk_hits'] += 1
+                    return df
+
+            self._metrics['misses'] += 1
+            return None
+
+    def put(self, query: str, versions: dict[str, int], df: pl.DataFrame) -> None:
+        key = self._key(query, versions)
+        size = int(df.estimated_size())
+        with self._lock:
+            latest = self._latest.get(key[0])
+            if latest is not None and latest != key:
+                self._invalidate(latest)
+            self._latest[key[0]] = key
+
+            # spill the large results into the local parquet tier
+            path = self._disk_path(key)
+            if path is not None and size >= self._spill_threshold:
+                if size > self._disk.max_weight:
+                    return
+                path_tmp = f'{path}.tmp'
+                df.write_parquet(path_tmp)
+                os.replace(path_tmp, path)
+                self._evict_disk(self._disk.put(
+                    path, None, os.path.getsize(path),
+                ))
+                return
+
+            for (evicted_key, _) in self._memory.put(key, df, size):
+                if self._latest.get(evicted_key[0]) == evicted_key:
+                    del self._latest[evicted_key[0]]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            hits = self._metrics['memory_hits'] + self._metrics['disk_hits']
+            requests = hits + self._metrics['misses']
+            return {
+                **self._metrics,
+                'hits': hits,
+                'hit_ratio': hits / requests if requests else 0.0,
+                'memory_bytes': self._memory.weight,
+                'memory_entries': len(self._memory),
+                'memory_evictions': self._memory.evictions,
+                'disk_bytes': self._disk.weight,
+                'disk_entries': len(self._disk),
+                'disk_evictions': self._disk.evictions,
+            }
+
+    def _disk_path(self, key: tuple[str, tuple]) -> str | None:
+        if self._disk_dir is None:
+            return None
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self._disk_dir, f'{digest}.parquet')
+
+    def _evict_disk(self, evicted: list[tuple[str, None]]) -> None:
+        for (path, _) in evicted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _invalidate(self, key: tuple[str, tuple]) -> None:
+        self._metrics['invalidations'] += 1
+        del self._latest[key[0]]
+        self._memory.pop(key)
+
+        path = self._disk_path(key)
+        if path is not None and path in self._disk:
+            self._disk.pop(path)
+            self._evict_disk([(path, None)])
+
+    def _key(self, query: str, versions: dict[str, int]) -> tuple[str, tuple]:
+        return normalize_sql(query), tuple(sorted(versions.items()))
+
+    def _load_disk_index(self) -> None:
+        os.makedirs(self._disk_dir, exist_ok=True)
+
+        # restore the LRU order from the last access times
+        entries = []
+        for entry in os.scandir(self._disk_dir):
+            if entry.is_file() and entry.name.endswith('.parquet'):
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.path, stat.st_size))
+        for (_, path, size) in sorted(entries):
+            self._evict_disk(self._disk.put(path, None, size))
+
+
+def normalize_sql(query: str) -> str:
+    # collapse the whitespaces outside of the quoted literals
+    tokens = re.split(r"('(?:[^']|'')*'|\"[^\"]*\")", query)
+    for index in range(0, len(tokens), 2):
+        tokens[index] = re.sub(r'\s+', ' ', tokens[index])
+    return ''.join(tokens).strip().rstrip(';').strip()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_file(path: str, data: bytes) -> None:
+    path_tmp = f'{path}.tmp'
+    with open(path_tmp, 'wb') as f:
+        f.write(data)
+    os.replace(path_tmp, path)
+
+
+def _normalize_etag(etag: str | None) -> str | None:
+    if etag is None:
+        return None
+    return etag.strip('"')
@@ -14,6 +14,29 @@ def dumps(data: dict[str, Any], codec: str) -> bytes | bytearray:
             raise Exception(f'Unknown encoding codec: {codec}')
 
 
+def infer(data: bytes) -> str:
+    if not data:
+        raise Exception('Empty data')
+
+    opcode = data[0]
+    if opcode <= _OPCODE_ASCIIEND:
+        return 'Json'
+    elif opcode == _OPCODE_MESSAGEPACK:
+        return 'MessagePack'
+    else:
+        raise Exception(f'cannot infer serde opcode')
+
+
+def is_binary(codec: str) -> bool:
+    match codec:
+        case 'MessagePack':
+            return True
+        case 'Json':
+            return False
+        case _:
+            raise Exception(f'Unknown encoding codec: {codec}')
+
+
 def loads(data: bytes) -> Optional[dict[str, Any]]:
     if not data:
         raise Exception('Empty data')
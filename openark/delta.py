@@ -0,0 +1,384 @@
+import json
+import logging
+import operator
+import os
+from typing import Any, Callable, Iterable
+from urllib.parse import unquote, urlparse
+
+import deltalake as dl
+import polars as pl
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+DELTA_LOG_DIRNAME = '_delta_log'
+
+_CDF_COLUMNS = ['_change_type', '_commit_version', '_commit_timestamp']
+_CDF_INSERTS = ['insert', 'update_postimage']
+
+_OPERATORS: dict[str, Callable[[pl.Expr, Any], pl.Expr]] = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda column, value: column.is_in(list(value)),
+    'not in': lambda column, value: ~column.is_in(list(value)),
+}
+
+Aggregate = tuple[str, str]
+Filter = tuple[str, str, Any]
+
+_MISSING = object()
+
+
+def filters_to_expr(filters: Iterable[Filter]) -> pl.Expr | None:
+    expr = None
+    for (column, op, value) in filters:
+        if op not in _OPERATORS:
+            raise ValueError(f'Unsupported filter operator: {op}')
+        cond = _OPERATORS[op](pl.col(column), value)
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def get_add_actions(table: dl.DeltaTable) -> pa.Table:
+    # NOTE: newer deltalake returns arro3 tables instead of pyarrow batches
+    return pa.table(table.get_add_actions(flatten=True))
+
+
+def get_arrow_schema(table: dl.DeltaTable) -> pa.Schema:
+    schema = table.schema()
+    if hasattr(schema, 'to_arrow'):
+        return pa.schema(schema.to_arrow())
+    return schema.to_pyarrow()
+
+
+def get_commit_options(
+    app_id: str,
+    version: int,
+    custom_metadata: dict[str, str],
+) -> dict[str, Any]:
+    if hasattr(dl, 'CommitProperties'):
+        return {
+            'commit_properties': dl.CommitProperties(
+                app_transactions=[dl.Transaction(app_id, version)],
+                custom_metadata=custom_metadata,
+            ),
+        }
+    return {
+        'custom_metadata': custom_metadata,
+    }
+
+
+def get_file_stats(table: dl.DeltaTable, small_file_size: int) -> dict[str, int]:
+    sizes = get_add_actions(table).column('size_bytes').to_pylist()
+    return {
+        'files': len(sizes),
+        'bytes': sum(sizes),
+        'small_files': sum(1 for size in sizes if size < small_file_size),
+    }
+
+
+def has_deletion_vectors(table: dl.DeltaTable) -> bool:
+    features = table.protocol().reader_features or []
+    return 'deletionVectors' in features
+
+
+def has_data_removals(
+    fs: pafs.FileSystem,
+    root: str,
+    start_version: int,
+    end_version: int,
+) -> bool:
+    for version in range(start_version, end_version + 1):
+        if _has_data_removals(read_commit(fs, root, version)):
+            return True
+    return False
+
+
+def is_cdf_enabled(table: dl.DeltaTable) -> bool:
+    configuration = table.metadata().configuration
+    return configuration.get('delta.enableChangeDataFeed', 'false').lower() == 'true'
+
+
+def load_filesystem(
+    table_uri: str,
+    storage_options: dict[str, str],
+) -> tuple[pafs.FileSystem, str]:
+    url = urlparse(table_uri)
+    if url.scheme not in ('s3', 's3a'):
+        fs, path = pafs.FileSystem.from_uri(
+            table_uri if url.scheme else os.path.abspath(table_uri),
+        )
+        return fs, path.rstrip('/')
+
+    endpoint = urlparse(storage_options['AWS_ENDPOINT_URL'])
+    fs = pafs.S3FileSystem(
+        access_key=storage_options.get('AWS_ACCESS_KEY_ID'),
+        secret_key=storage_options.get('AWS_SECRET_ACCESS_KEY'),
+        region=storage_options.get('AWS_REGION', 'us-east-1'),
+        scheme=endpoint.scheme or 'https',
+        endpoint_override=endpoint.netloc,
+    )
+    return fs, f'{url.netloc}{url.path}'.rstrip('/')
+
+
+def prune_files(
+    actions: pl.DataFrame,
+    schema: pa.Schema,
+    filters: Iterable[Filter],
+) -> pl.DataFrame:
+    dtypes = pl.from_arrow(schema.empty_table()).schema
+
+    # NOTE: a file is kept unless its partition values or stats rule it out
+    for (column, op, value) in filters:
+        partition = f'partition.{column}'
+        if partition in actions.columns:
+            cond = _OPERATORS[op](
+                pl.col(partition).cast(dtypes[column], strict=False),
+                value,
+            )
+        elif f'min.{column}' in actions.columns \
+                and f'max.{column}' in actions.columns:
+            cond = _may_contain(
+                pl.col(f'min.{column}'), pl.col(f'max.{column}'), op, value,
+            )
+            if cond is None:
+                continue
+        else:
+            continue
+
+        try:
+            actions = actions.filter(cond.fill_null(True))
+        except pl.exceptions.PolarsError:
+            # the value cannot be compared with the stats
+            continue
+    return actions
+
+
+def read_added_rows(
+    table: dl.DeltaTable,
+    fs: pafs.FileSystem,
+    root: str,
+    start_version: int,
+    end_version: int,
+) -> pl.DataFrame:
+    schema = get_arrow_schema(table)
+
+    # use the change data feed if the table records it
+    if is_cdf_enabled(table):
+        reader = table.load_cdf(
+            starting_version=start_version,
+            ending_version=end_version,
+        )
+        rows = pl.from_arrow(pa.table(reader.read_all()))
+        return rows \
+            .filter(pl.col('_change_type').is_in(_CDF_INSERTS)) \
+            .drop(_CDF_COLUMNS)
+
+    # otherwise read the files added by the new commits
+    frames = []
+    for version in range(start_version, end_version + 1):
+        actions = read_commit(fs, root, version)
+
+        # NOTE: the rewritten files hold the rows which already existed
+        if _has_data_removals(actions):
+            logging.warn(
+                f'Skipping the rewritten rows of version {version}; '
+                f'enable the change data feed to read them: {root}'
+            )
+            continue
+
+        for action in actions:
+            add = action.get('add')
+            if add is None or not add.get('dataChange', True):
+                continue
+            frames.append(_read_data_file(fs, root, add, schema))
+
+    if not frames:
+        return pl.from_arrow(schema.empty_table())
+    return pl.from_arrow(pa.concat_tables(frames))
+
+
+def read_commit(fs: pafs.FileSystem, root: str, version: int) -> list[dict[str, Any]]:
+    with fs.open_input_stream(f'{root}/{commit_path(version)}') as f:
+        commit = f.read().decode('utf-8')
+    return [
+        json.loads(line)
+        for line in commit.splitlines()
+        if line.strip()
+    ]
+
+
+def aggregate_from_stats(
+    table: dl.DeltaTable,
+    aggregates: Iterable[Aggregate],
+    filters: Iterable[Filter],
+) -> dict[str, Any] | None:
+    # the deleted rows are still counted in the stats
+    if has_deletion_vectors(table):
+        return None
+
+    actions = pl.from_arrow(get_add_actions(table))
+    filters = list(filters)
+    if any(f'partition.{column}' not in actions.columns for (column, _, _) in filters):
+        return None
+    actions = prune_files(actions, get_arrow_schema(table), filters)
+
+    # NOTE: the null partitions are kept by the pruning, but match no filters
+    if any(actions[f'partition.{column}'].null_count() > 0 for (column, _, _) in filters):
+        return None
+
+    schema = get_arrow_schema(table)
+    result = {}
+    for (func, column) in aggregates:
+        name = aggregate_name(func, column)
+        match func:
+            case 'count' if column == '*':
+                if actions['num_records'].null_count() > 0:
+                    return None
+                result[name] = int(actions['num_records'].sum())
+            case 'min' | 'max':
+                value = _aggregate_column_stats(actions, schema, func, column)
+                if value is _MISSING:
+                    return None
+                result[name] = value
+            case _:
+                return None
+    return result
+
+
+def aggregate_name(func: str, column: str) -> str:
+    return func if column == '*' else f'{func}({column})'
+
+
+def aggregates_to_exprs(aggregates: Iterable[Aggregate]) -> list[pl.Expr]:
+    exprs = []
+    for (func, column) in aggregates:
+        name = aggregate_name(func, column)
+        match func:
+            case 'count' if column == '*':
+                exprs.append(pl.len().cast(pl.Int64).alias(name))
+            case 'count':
+                exprs.append(pl.col(column).count().alias(name))
+            case 'min':
+                exprs.append(pl.col(column).min().alias(name))
+            case 'max':
+                exprs.append(pl.col(column).max().alias(name))
+            case _:
+                raise ValueError(f'Unsupported aggregate function: {func}')
+    return exprs
+
+
+def commit_path(version: int) -> str:
+    return f'{DELTA_LOG_DIRNAME}/{version:020d}.json'
+
+
+def _read_data_file(
+    fs: pafs.FileSystem,
+    root: str,
+    add: dict[str, Any],
+    schema: pa.Schema,
+) -> pa.Table:
+    data = pq.read_table(
+        f'{root}/{unquote(add["path"])}',
+        filesystem=fs,
+    )
+
+    # restore the partition columns, which are not stored in the files
+    for (name, value) in (add.get('partitionValues') or {}).items():
+        if name in data.column_names:
+            continue
+        field = schema.field(name)
+        data = data.append_column(
+            field,
+            pa.array([value] * data.num_rows, pa.string()).cast(field.type),
+        )
+
+    columns = [field.name for field in schema if field.name in data.column_names]
+    return data.select(columns).cast(pa.schema([
+        schema.field(name) for name in columns
+    ]))
+
+
+def _has_data_removals(actions: list[dict[str, Any]]) -> bool:
+    for action in actions:
+        remove = action.get('remove')
+        if remove is not None and remove.get('dataChange', True):
+            return True
+    return False
+
+
+def _may_contain(
+    min_value: pl.Expr,
+    max_value: pl.Expr,
+    op: str,
+    value: Any,
+) -> pl.Expr | None:
+    match op:
+        case '=' | '==':
+            return (min_value <= value) & (max_value >= value)
+        case '!=':
+            return (min_value != value) | (max_value != value)
+        case '<':
+            return min_value < value
+        case '<=':
+            return min_value <= value
+        case '>':
+            return max_value > value
+        case '>=':
+            return max_value >= value
+        case 'in':
+            values = list(value)
+            if not values:
+                return pl.lit(False)
+            cond = None
+            for item in values:
+                item_cond = (min_value <= item) & (max_value >= item)
+                cond = item_cond if cond is None else cond | item_cond
+            return cond
+        case _:
+            return None
+
+
+def _aggregate_column_stats(
+    actions: pl.DataFrame,
+    schema: pa.Schema,
+    func: str,
+    column: str,
+) -> Any:
+    dtypes = pl.from_arrow(schema.empty_table()).schema
+    if column not in dtypes:
+        return _MISSING
+
+    # the partition values are exact
+    partition = f'partition.{column}'
+    if partition in actions.columns:
+        values = actions[partition].cast(dtypes[column], strict=False)
+        return values.min() if func == 'min' else values.max()
+
+    # the string stats may be truncated
+    field = schema.field(column)
+    if not (
+        pa.types.is_integer(field.type)
+        or pa.types.is_floating(field.type)
+        or pa.types.is_temporal(field.type)
+        or pa.types.is_decimal(field.type)
+    ):
+        return _MISSING
+
+    stats = f'{func}.{column}'
+    null_count = f'null_count.{column}'
+    if stats not in actions.columns or null_count not in actions.columns:
+        return _MISSING
+
+    # the stats may be null only if all values of the file are null
+    values = actions[stats]
+    all_null = actions[null_count] == actions['num_records']
+    if (values.is_null() & ~all_null.fill_null(False)).any():
+        return _MISSING
+
+    return values.min() if func == 'min' else values.max()
@@ -0,0 +1,147 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import io
+import logging
+import time
+from typing import Any, Callable
+
+from openark.model import OpenArkModelChannel
+
+_FPS_WINDOW = 5.0  # in seconds
+
+
+class OpenArkFramePublisher:
+    def __init__(
+        self, /,
+        channel: OpenArkModelChannel,
+        format: str = 'jpg',
+        quality: int = 90,
+        queue_size: int = 1,
+        workers: int = 2,
+        payload_key: str | None = None,
+        encoder: Callable[[Any], bytes] | None = None,
+    ) -> None:
+        self._channel = channel
+        self._format = format.lower().lstrip('.')
+        self._quality = quality
+        self._payload_key = payload_key or f'frame.{self._format}'
+        self._encoder = encoder or self._encode
+
+        # keep only the latest frames
+        self._frames: deque[tuple[Any, Any]] = deque(maxlen=queue_size)
+        self._frames_ready = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._workers = [
+            asyncio.ensure_future(self._loop())
+            for _ in range(workers)
+        ]
+
+        self._published_at: deque[float] = deque()
+        self._started_at = time.monotonic()
+        self._stats = {
+            'submitted': 0,
+            'published': 0,
+            'dropped': 0,
+            'errors': 0,
+        }
+
+    async def __aenter__(self) -> 'OpenArkFramePublisher':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict[str, Any]:
+        self._expire_fps_window()
+        window = min(time.monotonic() - self._started_at, _FPS_WINDOW)
+        return {
+            **self._stats,
+            'fps': len(self._published_at) / window if window > 0 else 0.0,
+        }
+
+    def submit(self, frame: Any, value: Any = {}) -> bool:
+        self._stats['submitted'] += 1
+
+        # drop the stale frame if the publisher falls behind
+        dropped = len(self._frames) == self._frames.maxlen
+        if dropped:
+            self._stats['dropped'] += 1
+        self._frames.append((frame, value))
+        self._frames_ready.set()
+        return not dropped
+
+    def _encode(self, frame: Any) -> bytes:
+        try:
+            import cv2
+        except ImportError:
+            cv2 = None
+
+        if cv2 is not None:
+            if self._format in ('jpg', 'jpeg'):
+                params = [cv2.IMWRITE_JPEG_QUALITY, self._quality]
+            else:
+                params = []
+            is_ok, buffer = cv2.imencode(f'.{self._format}', frame, params)
+            if not is_ok:
+                raise ValueError(f'Failed to encode a frame: {self._format}')
+            return buffer.tobytes()
+
+        try:
+            from PIL import Image
+        except ImportError:
+            raise Exception(
+                'Image encoder is not installed: opencv-python or pillow'
+            )
+
+        if not isinstance(frame, Image.Image):
+            frame = Image.fromarray(frame)
+        buffer = io.BytesIO()
+        frame.save(
+            buffer,
+            format='JPEG' if self._format == 'jpg' else self._format.upper(),
+            quality=self._quality,
+        )
+        return buffer.getvalue()
+
+    def _expire_fps_window(self) -> None:
+        now = time.monotonic()
+        while self._published_at and now - self._published_at[0] > _FPS_WINDOW:
+            self._published_at.popleft()
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._frames:
+                self._frames_ready.clear()
+                await self._frames_ready.wait()
+                continue
+            frame, value = self._frames.popleft()
+
+            try:
+                data = await loop.run_in_executor(
+                    self._executor, self._encoder, frame,
+                )
+                await self._channel.publish(
+                    value,
+                    payloads={
+                        self._payload_key: data,
+                    },
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats['errors'] += 1
+                logging.warn(f'Failed to publish a frame: {e}')
+                continue
+
+            self._stats['published'] += 1
+            self._published_at.append(time.monotonic())
+            self._expire_fps_window()
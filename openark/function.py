@@ -1,19 +1,27 @@
-from typing import Any, Coroutine, Dict
+from typing import Any, AsyncIterator, Coroutine, Dict
 
+from openark.cache import OpenArkContentIndex, OpenArkPayloadCache
 from openark.model import OpenArkModel, OpenArkModelChannel, Payload
 from openark.messenger import Messenger
+from openark.session import OpenArkLoopSemaphore, OpenArkSessionPool
 
 
 class OpenArkFunction:
     def __init__(
         self, /,
         data: dict[str, Any],
+        cache: OpenArkPayloadCache | None,
+        content_index: OpenArkContentIndex | None,
         encoder: str,
+        inline_threshold: int,
         messenger: Messenger,
+        pack_threshold: int,
         queued: bool,
         timeout: int,
+        sessions: OpenArkSessionPool | None = None,
         storage_options: Dict[str, str] | None = None,
         timestamp: str | None = None,
+        upload_semaphore: OpenArkLoopSemaphore | None = None,
         user_name: str | None = None,
     ) -> None:
         self._timeout = timeout
@@ -23,8 +31,14 @@ class OpenArkFunction:
             messenger=messenger,
             model=OpenArkModel(
                 name=data['spec']['input'],
+                cache=cache,
+                content_index=content_index,
+                inline_threshold=inline_threshold,
+                pack_threshold=pack_threshold,
+                sessions=sessions,
                 storage_options=storage_options,
                 timestamp=timestamp,
+                upload_semaphore=upload_semaphore,
                 user_name=user_name,
             ),
             queued=queued,
@@ -34,8 +48,14 @@ class OpenArkFunction:
             messenger=messenger,
             model=OpenArkModel(
                 name=data['spec']['output'],
+                cache=cache,
+                content_index=content_index,
+                inline_threshold=inline_threshold,
+                pack_threshold=pack_threshold,
+                sessions=sessions,
                 storage_options=storage_options,
                 timestamp=timestamp,
+                upload_semaphore=upload_semaphore,
                 user_name=user_name,
             ),
             queued=queued,
@@ -53,8 +73,39 @@ class OpenArkFunction:
             load_payloads=load_payloads,
         )
 
-    def get_payload(self, payload: dict[str, Any]) -> Coroutine[Any, Any, Any]:
-        return self._input.get_payload(payload)
+    def download_to(
+        self,
+        payload: dict[str, Any],
+        path: str,
+        *,
+        parallel: int = 1,
+    ) -> Coroutine[Any, Any, int]:
+        return self._input.download_to(payload, path, parallel=parallel)
+
+    def get_payload(
+        self,
+        payload: dict[str, Any],
+        *,
+        parallel: int = 1,
+    ) -> Coroutine[Any, Any, Any]:
+        return self._input.get_payload(payload, parallel=parallel)
+
+    def get_payload_range(
+        self,
+        payload: dict[str, Any],
+        offset: int,
+        length: int | None = None,
+    ) -> Coroutine[Any, Any, bytes]:
+        return self._input.get_payload_range(payload, offset, length)
 
     def get_payload_url(self, payload: dict[str, Any]) -> str:
         return self._input.get_payload_url(payload)
+
+    def iter_payload(
+        self,
+        payload: dict[str, Any],
+        *,
+        offset: int = 0,
+        length: int | None = None,
+    ) -> AsyncIterator[bytes]:
+        return self._input.iter_payload(payload, offset=offset, length=length)
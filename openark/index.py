@@ -0,0 +1,361 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, Any, Iterable
+
+import deltalake as dl
+import msgpack
+import polars as pl
+import pyarrow.parquet as pq
+
+from openark.delta import Filter, get_add_actions, get_arrow_schema, load_filesystem
+
+if TYPE_CHECKING:
+    from openark.model import OpenArkModel
+
+_INDEX_FILENAME = 'index.msgpack'
+_INDEX_FORMAT = 1
+
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+_SQL_TERM = re.compile(
+    r'\s*(?:"?\w+"?\.)?"?(\w+)"?\s*(==|=|in)\s*(.+?)\s*',
+    re.IGNORECASE | re.DOTALL,
+)
+_SQL_UNSAFE = re.compile(
+    r'\b(?:except|intersect|join|not|or|over|union)\b',
+    re.IGNORECASE,
+)
+_SQL_SHAPE = re.compile(
+    r'\s*select\b.*?\bfrom\s+"?(\w+)"?'
+    r'(?:\s+(?:as\s+)?(?!(?:where|group|having|order|limit|qualify)\b)\w+)?'
+    r'(?:\s+where\b(.*?))?'
+    r'(?:\s+(?:group\s+by|having|order\s+by|limit|qualify)\b.*?)?'
+    r'\s*;?\s*',
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+class OpenArkKeyIndex:
+    def __init__(
+        self, /,
+        model: 'OpenArkModel',
+        path: str,
+        columns: list[str],
+        false_positive_rate: float = 0.01,
+        max_workers: int = 8,
+    ) -> None:
+        self._model = model
+        self._path = path
+        self._columns = columns
+        self._false_positive_rate = false_positive_rate
+        self._max_workers = max(max_workers, 1)
+        self._lock = threading.Lock()
+
+        self._dtypes: dict[str, pl.DataType] = {}
+        self._files: dict[str, dict[str, dict[str, Any]]] = {}
+        self._version = -1
+        self._load()
+
+        self.metrics = {
+            'updates': 0,
+            'indexed_files': 0,
+            'indexed_bytes': 0,
+            'removed_files': 0,
+        }
+
+    @property
+    def columns(self) -> list[str]:
+        return self._columns
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def version(self) -> int:
+        return self._version
+
+    def prune(self, actions: pl.DataFrame, filters: Iterable[Filter]) -> pl.DataFrame:
+        # NOTE: only the equality predicates can be answered by the index
+        probes = []
+        for (column, op, value) in filters:
+            if column not in self._columns or column not in self._dtypes:
+                continue
+            if op in ('=', '=='):
+                values = [value]
+            elif op == 'in':
+                values = list(value)
+            else:
+                continue
+            values = _cast_values(values, self._dtypes[column])
+            if values is not None:
+                probes.append((column, values))
+        if not probes:
+            return actions
+
+        with self._lock:
+            files = self._files
+        return actions.filter(pl.Series([
+            _may_contain(files.get(path), probes)
+            for path in actions['path'].to_list()
+        ], dtype=pl.Boolean))
+
+    def update(self, table: dl.DeltaTable) -> int:
+        with self._lock:
+            return self._update(table)
+
+    def _update(self, table: dl.DeltaTable) -> int:
+        version = table.version()
+
+        # NOTE: the dtypes are not stored, so a reloaded index needs them too
+        if not self._dtypes or version > self._version:
+            self._update_dtypes(table)
+
+        # NOTE: an older snapshot never rewinds the index,
+        # as its files which are not indexed are just scanned
+        if version <= self._version:
+            return 0
+
+        actions = get_add_actions(table)
+        paths = actions.column('path').to_pylist()
+        sizes = dict(zip(paths, actions.column('size_bytes').to_pylist()))
+
+        # NOTE: the data files are immutable, so only the new ones are read
+        removed = set(self._files) - set(paths)
+        for path in removed:
+            del self._files[path]
+        added = [
+            path for path in paths
+            if path not in self._files and '://' not in path
+        ]
+
+        if added:
+            fs, root = load_filesystem(
+                self._model._table_uri, self._model._storage_options,
+            )
+            with ThreadPoolExecutor(
+                max_workers=min(self._max_workers, len(added)),
+            ) as executor:
+                entries = executor.map(
+                    lambda path: self._index_file(fs, f'{root}/{path}'),
+                    added,
+                )
+                for (path, entry) in zip(added, entries):
+                    self._files[path] = entry
+                    self.metrics['indexed_files'] += 1
+                    self.metrics['indexed_bytes'] += sizes[path]
+
+        self._version = version
+        self._save()
+        self.metrics['updates'] += 1
+        self.metrics['removed_files'] += len(removed)
+        return len(added)
+
+    def _update_dtypes(self, table: dl.DeltaTable) -> None:
+        schema = pl.from_arrow(get_arrow_schema(table).empty_table()).schema
+        partition_columns = table.metadata().partition_columns
+        for column in self._columns:
+            # NOTE: the partition values are not stored in the data files
+            if column in partition_columns:
+                raise ValueError(
+                    f'Partition columns are pruned without an index: {self._model._name}.{column}'
+                )
+            dtype = schema.get(column)
+            if dtype is None or not (dtype.is_integer() or dtype == pl.String):
+                raise ValueError(
+                    f'Unsupported index column: {self._model._name}.{column}: {dtype}'
+                )
+            self._dtypes[column] = dtype
+
+    def _index_file(self, fs: Any, path: str) -> dict[str, dict[str, Any]]:
+        with fs.open_input_file(path) as f:
+            file = pq.ParquetFile(f)
+            present = [
+                column for column in self._columns
+                if column in file.schema_arrow.names
+            ]
+            data = pl.from_arrow(file.read(columns=present))
+
+        entry = {}
+        for column in self._columns:
+            # NOTE: a missing column is read as nulls, which match no keys
+            if column in present:
+                values = data[column].cast(self._dtypes[column]).drop_nulls()
+            else:
+                values = pl.Series(column, [], dtype=self._dtypes[column])
+            values = values.unique()
+
+            bloom = _BloomFilter.from_values(
+                values.to_list(), self._false_positive_rate,
+            )
+            entry[column] = {
+                'min': values.min(),
+                'max': values.max(),
+                'hashes': bloom.num_hashes,
+                'bits': bytes(bloom.bits),
+            }
+        return entry
+
+    def _load(self) -> None:
+        try:
+            with open(os.path.join(self._path, _INDEX_FILENAME), 'rb') as f:
+                data = msgpack.unpackb(f.read(), strict_map_key=False)
+        except FileNotFoundError:
+            return
+        except (ValueError, msgpack.exceptions.UnpackException) as e:
+            logging.warn(f'Dropping the corrupted index of {self._model._name}: {e}')
+            return
+
+        # rebuild the index if its layout has been changed
+        if data.get('format') != _INDEX_FORMAT \
+                or data.get('columns') != self._columns \
+                or data.get('false_positive_rate') != self._false_positive_rate:
+            return
+        self._files = data['files']
+        self._version = data['version']
+
+    def _save(self) -> None:
+        os.makedirs(self._path, exist_ok=True)
+        path = os.path.join(self._path, _INDEX_FILENAME)
+        path_tmp = f'{path}.tmp'
+        with open(path_tmp, 'wb') as f:
+            f.write(msgpack.packb({
+                'format': _INDEX_FORMAT,
+                'columns': self._columns,
+                'false_positive_rate': self._false_positive_rate,
+                'version': self._version,
+                'files': self._files,
+            }))
+        os.replace(path_tmp, path)
+
+
+class _BloomFilter:
+    def __init__(self, bits: bytearray, num_hashes: int) -> None:
+        self.bits = bits
+        self.num_hashes = num_hashes
+
+    @classmethod
+    def from_values(cls, values: list[Any], false_positive_rate: float) -> '_BloomFilter':
+        n = max(len(values), 1)
+        m = max(math.ceil(-n * math.log(false_positive_rate) / math.log(2) ** 2), 64)
+        k = max(round(m / n * math.log(2)), 1)
+
+        bloom = cls(bytearray((m + 7) // 8), k)
+        for value in values:
+            for bit in bloom._positions(value):
+                bloom.bits[bit >> 3] |= 1 << (bit & 7)
+        return bloom
+
+    def __contains__(self, value: Any) -> bool:
+        return all(
+            self.bits[bit >> 3] & (1 << (bit & 7))
+            for bit in self._positions(value)
+        )
+
+    def _positions(self, value: Any) -> Iterable[int]:
+        # double hashing: h1 + i * h2
+        digest = hashlib.blake2b(
+            str(value).encode('utf-8'), digest_size=16,
+        ).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        m = len(self.bits) * 8
+        return ((h1 + i * h2) % m for i in range(self.num_hashes))
+
+
+def find_key_filters(
+    query: str,
+    table: str,
+    columns: Iterable[str],
+) -> list[Filter]:
+    columns = set(columns)
+
+    # hide the string literals from the keyword checks below
+    literals = []
+
+    def hide(matched: re.Match) -> str:
+        literals.append(matched.group(0)[1:-1].replace("''", "'"))
+        return f'\x00{len(literals) - 1}\x00'
+
+    query = _SQL_LITERAL.sub(hide, query)
+
+    # NOTE: only a plain conjunction over a single relation is safe to prune
+    if _SQL_UNSAFE.search(query) \
+            or len(re.findall(r'\bselect\b', query, re.IGNORECASE)) != 1:
+        return []
+    shape = _SQL_SHAPE.fullmatch(query)
+    if shape is None or shape.group(1).lower() != table.lower() \
+            or shape.group(2) is None:
+        return []
+
+    filters = []
+    for term in re.split(r'\band\b', shape.group(2), flags=re.IGNORECASE):
+        matched = _SQL_TERM.fullmatch(term)
+        if matched is None:
+            continue
+        column, op, value = matched.groups()
+        if column not in columns:
+            continue
+
+        if op.lower() == 'in':
+            if not (value.startswith('(') and value.endswith(')')):
+                continue
+            values = [
+                _parse_sql_value(item, literals)
+                for item in value[1:-1].split(',')
+            ]
+            if any(item is None for item in values):
+                continue
+            filters.append((column, 'in', values))
+        else:
+            value = _parse_sql_value(value, literals)
+            if value is not None:
+                filters.append((column, '=', value))
+    return filters
+
+
+def _cast_values(values: list[Any], dtype: pl.DataType) -> list[Any] | None:
+    if any(value is None for value in values):
+        return None
+    try:
+        series = pl.Series(values, strict=False).cast(dtype)
+    except pl.exceptions.PolarsError:
+        return None
+    if series.null_count() > 0:
+        return None
+    return series.to_list()
+
+
+def _may_contain(
+    entry: dict[str, dict[str, Any]] | None,
+    probes: list[tuple[str, list[Any]]],
+) -> bool:
+    # the files which are not indexed yet are always scanned
+    if entry is None:
+        return True
+
+    for (column, values) in probes:
+        stats = entry[column]
+        bloom = _BloomFilter(stats['bits'], stats['hashes'])
+        if not any(
+            stats['min'] is not None
+            and stats['min'] <= value <= stats['max']
+            and value in bloom
+            for value in values
+        ):
+            return False
+    return True
+
+
+def _parse_sql_value(value: str, literals: list[str]) -> Any:
+    value = value.strip()
+    matched = re.fullmatch(r'\x00(\d+)\x00', value)
+    if matched is not None:
+        return literals[int(matched.group(1))]
+    if _SQL_NUMBER.fullmatch(value):
+        return float(value) if '.' in value else int(value)
+    return None
@@ -9,6 +9,9 @@ class Messenger(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     async def close(self) -> None: ...
 
+    def is_connected(self) -> bool:
+        return True
+
     @abc.abstractmethod
     def publisher(
         self,
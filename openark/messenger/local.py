@@ -0,0 +1,132 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from openark.messenger import Messenger, Publisher, Service, Subscriber
+
+_DEFAULT_QUEUE_SIZE = 1024
+
+Handler = Callable[[bytes], Awaitable[bytes]]
+
+
+class LocalMessenger(Messenger):
+    def __init__(self) -> None:
+        super().__init__()
+        self._handlers: dict[str, Handler] = {}
+        self._subscribers: dict[str, list['LocalSubscriber']] = {}
+
+    async def close(self) -> None:
+        self._handlers.clear()
+        self._subscribers.clear()
+
+    def publisher(
+        self,
+        topic: str,
+        reply: str | None,
+    ) -> 'LocalPublisher':
+        return LocalPublisher(
+            messenger=self,
+            topic=topic,
+        )
+
+    def serve(self, topic: str, handler: Handler) -> None:
+        self._handlers[topic] = handler
+
+    def service(
+        self,
+        topic: str,
+        timeout_sec: float | None = 10.0,
+    ) -> 'LocalService':
+        return LocalService(
+            messenger=self,
+            topic=topic,
+            timeout_sec=timeout_sec,
+        )
+
+    def subscriber(
+        self,
+        topic: str,
+        queue: str | None,
+    ) -> 'LocalSubscriber':
+        return LocalSubscriber(
+            messenger=self,
+            topic=topic,
+            queue=queue,
+        )
+
+    async def _dispatch(self, topic: str, data: bytes) -> None:
+        subscribers = self._subscribers.get(topic, [])
+
+        # deliver once per queue group, as NATS does
+        groups: set[str] = set()
+        for subscriber in list(subscribers):
+            if subscriber._queue:
+                if subscriber._queue in groups:
+                    continue
+                groups.add(subscriber._queue)
+            # NOTE: slow consumers apply backpressure to the publishers
+            await subscriber._inner.put(data)
+
+        # rotate the members of the queue groups
+        if groups and len(subscribers) > 1:
+            subscribers.append(subscribers.pop(0))
+
+
+class LocalPublisher(Publisher):
+    def __init__(
+        self,
+        messenger: LocalMessenger,
+        topic: str,
+    ) -> None:
+        super().__init__()
+        self._messenger = messenger
+        self._topic = topic
+
+    async def __call__(self, data: bytes | bytearray) -> None:
+        await self._messenger._dispatch(self._topic, bytes(data))
+
+
+class LocalService(Service):
+    def __init__(
+        self,
+        messenger: LocalMessenger,
+        topic: str,
+        timeout_sec: float | None,
+    ) -> None:
+        super().__init__()
+        self._messenger = messenger
+        self._topic = topic
+        self._timeout_sec = timeout_sec or 10.0
+
+    async def __call__(self, data: bytes | bytearray) -> bytes:
+        handler = self._messenger._handlers.get(self._topic)
+        if handler is None:
+            raise Exception(f'No responders are available: {self._topic}')
+
+        return await asyncio.wait_for(
+            handler(bytes(data)),
+            timeout=self._timeout_sec,
+        )
+
+
+class LocalSubscriber(Subscriber):
+    def __init__(
+        self,
+        messenger: LocalMessenger,
+        topic: str,
+        queue: str | None,
+    ) -> None:
+        super().__init__()
+        self._messenger = messenger
+        self._topic = topic
+        self._queue = queue or ''
+
+        self._inner: asyncio.Queue | None = None
+
+    async def __anext__(self) -> bytes:
+        if self._inner is None:
+            self._inner = asyncio.Queue(maxsize=_DEFAULT_QUEUE_SIZE)
+            self._messenger._subscribers \
+                .setdefault(self._topic, []) \
+                .append(self)
+
+        return await self._inner.get()
@@ -13,6 +13,9 @@ class NatsMessenger(Messenger):
     async def close(self) -> None:
         return await self._nc.close()
 
+    def is_connected(self) -> bool:
+        return self._nc.is_connected
+
     def publisher(
         self,
         topic: str,
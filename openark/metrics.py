@@ -0,0 +1,22 @@
+import math
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+
+    # nearest-rank percentile
+    values = sorted(values)
+    index = math.ceil(q / 100.0 * len(values)) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+def summarize_latencies(
+    latencies: list[float],
+    prefix: str = 'latency',
+) -> dict[str, float]:
+    return {
+        f'{prefix}_p50': percentile(latencies, 50),
+        f'{prefix}_p99': percentile(latencies, 99),
+        f'{prefix}_max': max(latencies, default=0.0),
+    }
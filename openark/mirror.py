@@ -0,0 +1,246 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+from urllib.parse import unquote
+
+import deltalake as dl
+import pyarrow.fs as pafs
+
+from openark.delta import DELTA_LOG_DIRNAME, get_add_actions, load_filesystem, read_commit
+
+if TYPE_CHECKING:
+    from openark.model import OpenArkModel
+
+_LAST_CHECKPOINT_FILENAME = '_last_checkpoint'
+
+
+class OpenArkDeltaMirror:
+    def __init__(
+        self, /,
+        model: 'OpenArkModel',
+        path: str,
+        max_workers: int = 8,
+        retention: float = 600.0,
+    ) -> None:
+        self._model = model
+        self._path = path
+        self._max_workers = max(max_workers, 1)
+        self._lock = threading.Lock()
+        self._removed: dict[str, float] = {}
+        self._retention = retention
+
+        self._fs, self._remote_path = load_filesystem(
+            table_uri=self._model._table_uri,
+            storage_options=self._model._storage_options,
+        )
+        os.makedirs(os.path.join(self._path, DELTA_LOG_DIRNAME), exist_ok=True)
+
+        self.metrics = {
+            'syncs': 0,
+            'downloaded_files': 0,
+            'downloaded_bytes': 0,
+            'removed_files': 0,
+        }
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def sync(self) -> int:
+        with self._lock:
+            return self._sync()
+
+    def version(self) -> int:
+        versions = [
+            int(name[:-len('.json')])
+            for name in os.listdir(os.path.join(self._path, DELTA_LOG_DIRNAME))
+            if name.endswith('.json') and name[:-len('.json')].isdigit()
+        ]
+        return max(versions, default=-1)
+
+    def _sync(self) -> int:
+        table = dl.DeltaTable(
+            table_uri=self._model._table_uri,
+            storage_options=self._model._storage_options,
+        )
+        remote_version = table.version()
+        local_version = self.version()
+        if local_version == remote_version:
+            self._remove_expired()
+            return local_version
+
+        # replay the new commits, or compare the snapshots if not possible
+        # NOTE: the first sync also finds the files left by a previous run
+        changes = None
+        if local_version >= 0 and self.metrics['syncs'] > 0:
+            changes = self._replay_log(local_version, remote_version)
+        if changes is None:
+            changes = self._diff_files(table)
+        added, removed = changes
+
+        # NOTE: the data files are ready before the log refers them
+        self._download_all(added)
+        self._sync_log(remote_version)
+
+        # keep the removed files for a while, as the pending scans may read them
+        now = time.monotonic()
+        for path in added:
+            self._removed.pop(path, None)
+        for path in removed:
+            self._removed.setdefault(path, now)
+        self._remove_expired()
+
+        self.metrics['syncs'] += 1
+        return remote_version
+
+    def _diff_files(self, table: dl.DeltaTable) -> tuple[list[str], list[str]]:
+        remote = set(get_add_actions(table).column('path').to_pylist())
+        local = set(self._list_local_files())
+        return (
+            sorted(remote),
+            sorted(local - remote),
+        )
+
+    def _remove_expired(self) -> None:
+        now = time.monotonic()
+        for (path, removed_at) in list(self._removed.items()):
+            if now - removed_at < self._retention:
+                continue
+            del self._removed[path]
+            try:
+                os.remove(os.path.join(self._path, path))
+                self.metrics['removed_files'] += 1
+            except FileNotFoundError:
+                pass
+
+    def _replay_log(
+        self,
+        local_version: int,
+        remote_version: int,
+    ) -> tuple[list[str], list[str]] | None:
+        added: dict[str, None] = {}
+        removed: set[str] = set()
+        for version in range(local_version + 1, remote_version + 1):
+            try:
+                actions = read_commit(self._fs, self._remote_path, version)
+            except FileNotFoundError:
+                # the commits have been cleaned up
+                return None
+
+            for action in actions:
+                if 'add' in action:
+                    path = unquote(action['add']['path'])
+                    added[path] = None
+                    removed.discard(path)
+                elif 'remove' in action:
+                    path = unquote(action['remove']['path'])
+                    added.pop(path, None)
+                    removed.add(path)
+
+        return (
+            list(added),
+            sorted(removed),
+        )
+
+    def _sync_log(self, remote_version: int) -> None:
+        log_dir = f'{self._remote_path}/{DELTA_LOG_DIRNAME}'
+        local_log_dir = os.path.join(self._path, DELTA_LOG_DIRNAME)
+
+        names = []
+        for info in self._fs.get_file_info(pafs.FileSelector(log_dir)):
+            if info.type != pafs.FileType.File:
+                continue
+            name = info.base_name
+            version = name.split('.', 1)[0]
+
+            # skip the commits newer than the synced data files
+            if not version.isdigit() or int(version) > remote_version:
+                continue
+            if os.path.exists(os.path.join(local_log_dir, name)):
+                continue
+            names.append(name)
+
+        # write the commits in order so that a partial sync stays readable
+        for name in sorted(names):
+            self._download(f'{DELTA_LOG_DIRNAME}/{name}')
+
+        # point the readers to the latest synced checkpoint
+        checkpoint = os.path.join(local_log_dir, _LAST_CHECKPOINT_FILENAME)
+        try:
+            data = self._read_remote(
+                f'{DELTA_LOG_DIRNAME}/{_LAST_CHECKPOINT_FILENAME}',
+            )
+        except FileNotFoundError:
+            return
+        if json.loads(data).get('version', 0) <= remote_version:
+            _write_file(checkpoint, data.encode('utf-8'))
+
+    def _download(self, path: str) -> int:
+        local_path = os.path.join(self._path, path)
+        local_path_tmp = f'{local_path}.tmp'
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+        size = 0
+        with self._fs.open_input_stream(f'{self._remote_path}/{path}') as src, \
+                open(local_path_tmp, 'wb') as dst:
+            while True:
+                chunk = src.read(1 << 20)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                size += len(chunk)
+        os.replace(local_path_tmp, local_path)
+        return size
+
+    def _download_all(self, paths: list[str]) -> None:
+        paths = [
+            path for path in paths
+            if not _is_absolute(path) and not self._exists(path)
+        ]
+        if not paths:
+            return
+
+        with ThreadPoolExecutor(
+            max_workers=min(self._max_workers, len(paths)),
+        ) as executor:
+            for size in executor.map(self._download, paths):
+                self.metrics['downloaded_files'] += 1
+                self.metrics['downloaded_bytes'] += size
+
+    def _exists(self, path: str) -> bool:
+        return os.path.exists(os.path.join(self._path, path))
+
+    def _list_local_files(self) -> list[str]:
+        files = []
+        for (root, dirs, names) in os.walk(self._path):
+            if root == self._path and DELTA_LOG_DIRNAME in dirs:
+                dirs.remove(DELTA_LOG_DIRNAME)
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                files.append(os.path.relpath(
+                    os.path.join(root, name), self._path,
+                ).replace(os.sep, '/'))
+        return files
+
+    def _read_remote(self, path: str) -> str:
+        with self._fs.open_input_stream(f'{self._remote_path}/{path}') as f:
+            return f.read().decode('utf-8')
+
+
+def _is_absolute(path: str) -> bool:
+    if '://' in path:
+        logging.warn(f'Skipping the absolute data file path: {path}')
+        return True
+    return False
+
+
+def _write_file(path: str, data: bytes) -> None:
+    path_tmp = f'{path}.tmp'
+    with open(path_tmp, 'wb') as f:
+        f.write(data)
+    os.replace(path_tmp, path)
@@ -1,13 +1,22 @@
 import aiohttp
 import asyncio
 import base64
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import datetime
+import hashlib
 import io
 import json
 import logging
 import os
-from typing import Any, Coroutine, Dict, Optional, TypeVar
+import re
+import tempfile
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Iterable, Iterator, Optional, TypeVar
 from urllib.parse import urlparse
+import uuid
 
 import deltalake as dl
 import inflection
@@ -15,72 +24,476 @@ import kubernetes as kube
 import lancedb
 from lancedb.table import LanceTable
 import miniopy_async as minio
+from miniopy_async.error import S3Error
 import polars as pl
+import pyarrow as pa
+import pyarrow.dataset as pads
+import pyarrow.parquet as pq
 
 from openark import codec, drawer
-from openark.messenger import Messenger
+from openark.approx import iter_estimates
+from openark.cache import OpenArkContentIndex, OpenArkPayloadCache, OpenArkQueryCache
+from openark.delta import Aggregate, Filter, aggregate_from_stats, aggregates_to_exprs, filters_to_expr, get_add_actions, get_arrow_schema, get_file_stats, load_filesystem, prune_files, read_added_rows
+from openark.index import OpenArkKeyIndex, find_key_filters
+from openark.messenger import Messenger, Publisher, Subscriber
+from openark.mirror import OpenArkDeltaMirror
+from openark.rollup import OpenArkRollup
+from openark.session import OpenArkLoopSemaphore, OpenArkSessionPool
+from openark.spool import OpenArkSpool
 
 Payload = bytes | dict[str, Any]
 T = TypeVar('T')
 
+_DEFAULT_BATCH_SIZE = 64 << 10  # 64 Ki rows
+_DEFAULT_CHUNK_SIZE = 1 << 20  # 1 MiB
+_DEFAULT_INDEX_DIR = os.path.expanduser('~/.cache/openark/index')
+_DEFAULT_PART_SIZE = 8 << 20  # 8 MiB
+_MAINTENANCE_HISTORY_LIMIT = 100  # in commits
+_SPOOL_RETRY_INTERVAL = 1.0  # in seconds
+
 
 class OpenArkGlobalNamespace:
-    def __init__(self, namespace: str) -> None:
+    def __init__(
+        self,
+        namespace: str,
+        index_dir: str | None = None,
+        lazy: bool = False,
+        max_workers: int = 8,
+        mirror_dir: str | None = None,
+        query_cache: OpenArkQueryCache | None = None,
+        refresh_interval: float | None = None,
+        sessions: OpenArkSessionPool | None = None,
+    ) -> None:
         self._delta_ctx_instance: pl.SQLContext = None
+        self._delta_lock = threading.RLock()
+        self._delta_tables: dict[str, dl.DeltaTable] = {}
+        self._delta_versions: dict[str, int] = {}
+        self._lazy = lazy
+        self._maintenance: _Periodic | None = None
+        self._max_workers = max(max_workers, 1)
         self._namespace = namespace
         self._kube = kube.client.CustomObjectsApi()
+        self._query_cache = query_cache
+        self._refresher: _Periodic | None = None
+        self._rollups: dict[str, OpenArkRollup] = {}
+        self._sessions = sessions or OpenArkSessionPool.from_env()
+        self._sessions_owned = sessions is None
 
         # load models
-        self._models: dict[str, OpenArkModel] = {}
-        for (model, storage_name) in _load_models(self._kube, self._namespace):
-            if model._table_name in self._models:
-                continue
+        candidates: dict[str, list[tuple[OpenArkModel, str]]] = {}
+        for (model, storage_name) in _load_models(
+            self._kube, self._namespace, self._max_workers, mirror_dir,
+            index_dir, self._sessions,
+        ):
+            candidates.setdefault(model._table_name, []) \
+                .append((model, storage_name))
 
-            try:
-                check_init = model.to_delta().version() > 0
-            except dl.exceptions.TableNotFoundError:
-                check_init = False
-            if not check_init:
-                logging.warn(
-                    f'Model {model._name} is not inited yet on {storage_name}; skipping...'
-                )
-                continue
+        self._models: dict[str, OpenArkModel] = {}
+        self._models_pending: dict[str, list[tuple[OpenArkModel, str]]] = {}
+        if self._lazy:
+            # NOTE: the tables are checked when a query first references them
+            self._models_pending = candidates
+        else:
+            self._models.update(self._select_models(candidates))
 
-            logging.info(f'Loading model: {model._name}')
-            self._models[model._table_name] = model
+        if refresh_interval:
+            self.start_refresher(refresh_interval)
 
     def _build_delta_ctx(self) -> pl.SQLContext:
         ctx = pl.SQLContext()
-        for model in self._models.values():
-            ctx.register(
-                name=model._table_name,
-                frame=model.to_delta_polars(),
-            )
+        with self._delta_lock:
+            self._delta_tables.clear()
+            self._delta_versions.clear()
+            self._refresh_delta_ctx(ctx, list(self._models.values()))
         return ctx
 
     def delta_ctx(self, /, refresh: bool = False) -> pl.SQLContext:
-        if self._delta_ctx_instance is None or refresh:
+        if self._delta_ctx_instance is None:
             self._delta_ctx_instance = self._build_delta_ctx()
+        elif refresh:
+            self.refresh()
         return self._delta_ctx_instance
 
-    def delta_sql(self, query: str, *, refresh: bool = False) -> pl.LazyFrame:
-        return self.delta_ctx(refresh=refresh).execute(query)
+    def delta_sql(
+        self,
+        query: str,
+        *,
+        cache: bool = False,
+        refresh: bool = False,
+    ) -> pl.LazyFrame:
+        ctx = self.delta_ctx(refresh=refresh)
+        with self._delta_lock:
+            if self._models_pending:
+                self._register_pending_models(ctx, query)
+            lf = self._execute_rollup(ctx, query)
+            if lf is None:
+                lf = self._execute_indexed(query)
+            if lf is None:
+                lf = ctx.execute(query)
+            if not cache:
+                return lf
+
+            # key the results by the versions of the referenced tables
+            versions = {
+                table: self._delta_versions[table]
+                for table in _find_referenced_tables(query, self._delta_versions)
+            }
+
+        if self._query_cache is None:
+            self._query_cache = OpenArkQueryCache()
+        df = self._query_cache.get(query, versions)
+        if df is None:
+            df = lf.collect()
+            self._query_cache.put(query, versions, df)
+        return df.lazy()
+
+    def add_index(
+        self,
+        table: str,
+        columns: list[str],
+        false_positive_rate: float = 0.01,
+    ) -> OpenArkKeyIndex:
+        model, _ = self._get_model(table)
+        return model.add_index(columns, false_positive_rate=false_positive_rate)
+
+    def add_rollup(
+        self,
+        table: str,
+        name: str,
+        columns: list[str],
+        every: str = '1m',
+        group_by: list[str] | None = None,
+        time_column: str = '__timestamp',
+    ) -> OpenArkRollup:
+        model, _ = self._get_model(table)
+
+        ctx = self.delta_ctx()
+        with self._delta_lock:
+            rollup = OpenArkRollup(
+                model=model,
+                name=name,
+                columns=columns,
+                every=every,
+                group_by=group_by,
+                time_column=time_column,
+            )
+            self._rollups[rollup.name] = rollup
+            self._update_rollup(ctx, rollup)
+        return rollup
+
+    async def close(self) -> None:
+        self.stop_maintenance()
+        self.stop_refresher()
+        if self._sessions_owned:
+            await self._sessions.close()
+
+    def delta_aggregate(
+        self,
+        table: str,
+        aggregates: list[Aggregate],
+        filters: list[Filter] | None = None,
+    ) -> pl.DataFrame:
+        model, version = self._get_model(table)
+
+        # NOTE: pinned to the version which the SQL context sees
+        return model.aggregate(aggregates, filters=filters, version=version)
+
+    def delta_approx(
+        self,
+        table: str,
+        aggregates: list[Aggregate],
+        filters: list[Filter] | None = None,
+        **kwargs: Any,
+    ) -> pl.DataFrame:
+        model, version = self._get_model(table)
+        return model.approximate(
+            aggregates, filters=filters, version=version, **kwargs,
+        )
+
+    def delta_approx_iter(
+        self,
+        table: str,
+        aggregates: list[Aggregate],
+        filters: list[Filter] | None = None,
+        **kwargs: Any,
+    ) -> Iterator[pl.DataFrame]:
+        model, version = self._get_model(table)
+        return model.iter_approximate(
+            aggregates, filters=filters, version=version, **kwargs,
+        )
+
+    def delta_sql_iter(
+        self,
+        query: str,
+        *,
+        arrow: bool = False,
+        batch_size: int = _DEFAULT_BATCH_SIZE,
+        refresh: bool = False,
+        spill_dir: str | None = None,
+    ) -> Iterator[pl.DataFrame | pa.RecordBatch]:
+        lf = self.delta_sql(query, refresh=refresh)
+        return _iter_lazy_batches(lf, batch_size, arrow, spill_dir)
+
+    def delta_sql_sink(
+        self,
+        query: str,
+        path: str,
+        *,
+        format: str | None = None,
+        refresh: bool = False,
+    ) -> str:
+        lf = self.delta_sql(query, refresh=refresh)
+        _sink_lazy(lf, path, format)
+        return path
 
     def delta_sql_and_draw(
         self,
         query: str,
         style: Optional[str] = None,
         *,
+        cache: bool = False,
         refresh: bool = False,
     ) -> None:
         # collect data frame
-        lf = self.delta_sql(query, refresh=refresh)
+        lf = self.delta_sql(query, cache=cache, refresh=refresh)
 
         # draw
         drawer.draw(lf, style)
 
+    def delta_versions(self) -> dict[str, int]:
+        with self._delta_lock:
+            return dict(self._delta_versions)
+
+    def get_query_cache_stats(self) -> dict[str, Any] | None:
+        if self._query_cache is None:
+            return None
+        return self._query_cache.stats()
+
+    def maintain(
+        self,
+        *,
+        benchmark_query: str | None = None,
+        min_small_files: int = 16,
+        retention_hours: int | None = None,
+        small_file_size: int = 32 << 20,
+        tables: list[str] | None = None,
+        target_size: int | None = None,
+        vacuum: bool = True,
+        z_order: dict[str, list[str]] | None = None,
+    ) -> list[dict[str, Any]]:
+        z_order = z_order or {}
+
+        reports = []
+        for (name, model) in list(self._models.items()):
+            if tables is not None and name not in tables:
+                continue
+            try:
+                report = _maintain_model(
+                    model=model,
+                    benchmark_query=benchmark_query,
+                    min_small_files=min_small_files,
+                    retention_hours=retention_hours,
+                    small_file_size=small_file_size,
+                    target_size=target_size,
+                    vacuum=vacuum,
+                    z_order=z_order.get(name),
+                )
+            except Exception as e:
+                logging.warn(f'Failed to maintain model {model._name}: {e}')
+                continue
+            if report is not None:
+                reports.append(report)
+
+        # let the SQL context see the rewritten tables
+        if reports and self._delta_ctx_instance is not None:
+            self.refresh()
+        return reports
+
+    def refresh(self) -> list[str]:
+        if self._delta_ctx_instance is None:
+            self._delta_ctx_instance = self._build_delta_ctx()
+            return list(self._delta_versions)
+
+        with self._delta_lock:
+            return self._refresh_delta_ctx(
+                self._delta_ctx_instance,
+                list(self._models.values()),
+            )
+
+    def start_refresher(self, interval: float) -> None:
+        self.stop_refresher()
+        self._refresher = _Periodic(
+            name=f'openark-refresher-{self._namespace}',
+            interval=interval,
+            target=self.refresh,
+        )
+        self._refresher.start()
+
+    def start_maintenance(self, interval: float, **kwargs: Any) -> None:
+        self.stop_maintenance()
+        self._maintenance = _Periodic(
+            name=f'openark-maintenance-{self._namespace}',
+            interval=interval,
+            target=lambda: self.maintain(**kwargs),
+        )
+        self._maintenance.start()
+
+    def stop_maintenance(self) -> None:
+        if self._maintenance is not None:
+            self._maintenance.stop()
+            self._maintenance = None
+
+    def stop_refresher(self) -> None:
+        if self._refresher is not None:
+            self._refresher.stop()
+            self._refresher = None
+
     def update(self) -> None:
-        self._delta_ctx_instance = self._build_delta_ctx()
+        self.refresh()
+
+    def _execute_indexed(self, query: str) -> pl.LazyFrame | None:
+        tables = _find_referenced_tables(query, self._delta_versions)
+        if len(tables) != 1:
+            return None
+        model = self._models.get(tables[0])
+        if model is None or model.index is None:
+            return None
+        filters = find_key_filters(query, tables[0], model.index.columns)
+        if not filters:
+            return None
+
+        # NOTE: the query itself still applies its predicates to the rows
+        table = model._load_delta(version=self._delta_versions[tables[0]])
+        ctx = pl.SQLContext()
+        ctx.register(name=tables[0], frame=model._scan_files(table, filters))
+        return ctx.execute(query)
+
+    def _execute_rollup(self, ctx: pl.SQLContext, query: str) -> pl.LazyFrame | None:
+        tables = _find_referenced_tables(query, self._delta_versions)
+        if len(tables) != 1 or tables[0] not in self._delta_tables:
+            return None
+        version = self._delta_versions[tables[0]]
+
+        schema = None
+        for rollup in self._rollups.values():
+            # NOTE: the rollup should cover exactly the rows being queried
+            if rollup.source != tables[0] \
+                    or rollup.name not in self._delta_versions \
+                    or rollup.source_version() != version:
+                continue
+            if schema is None:
+                schema = pl.from_arrow(
+                    get_arrow_schema(self._delta_tables[tables[0]]).empty_table(),
+                ).schema
+            rewritten = rollup.rewrite(query, schema)
+            if rewritten is None:
+                continue
+
+            # keep the names and the types of the original results
+            logging.debug(f'Answering from rollup {rollup.name}: {rewritten}')
+            raw_schema = ctx.execute(query).collect_schema()
+            return ctx.execute(rewritten).select([
+                pl.nth(index).cast(dtype).alias(name)
+                for (index, (name, dtype)) in enumerate(raw_schema.items())
+            ])
+        return None
+
+    def _get_model(self, table: str) -> tuple['OpenArkModel', int | None]:
+        ctx = self.delta_ctx()
+        with self._delta_lock:
+            if table in self._models_pending:
+                self._register_pending_models(ctx, table)
+            model = self._models.get(table)
+            if model is None:
+                raise ValueError(f'No such model table: {table}')
+            return model, self._delta_versions.get(table)
+
+    def _map(self, fn: Callable[[Any], T], items: Iterable[Any]) -> list[T]:
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=min(self._max_workers, len(items)),
+        ) as executor:
+            return list(executor.map(fn, items))
+
+    def _refresh_delta_ctx(
+        self,
+        ctx: pl.SQLContext,
+        models: list['OpenArkModel'],
+    ) -> list[str]:
+        def load(model: OpenArkModel) -> tuple[int, pl.LazyFrame | None]:
+            name = model._table_name
+            table = self._delta_tables.get(name)
+            if table is None:
+                table = self._delta_tables[name] = model.to_delta()
+            elif model._version is None:
+                table.update_incremental()
+
+            # NOTE: only the changed tables are scanned again
+            version = table.version()
+            if self._delta_versions.get(name) == version:
+                return version, None
+            return version, model.to_delta_polars(version=version)
+
+        changed = []
+        for (model, (version, frame)) in zip(models, self._map(load, models)):
+            if frame is None:
+                continue
+            ctx.register(name=model._table_name, frame=frame)
+            self._delta_versions[model._table_name] = version
+            changed.append(model._table_name)
+
+        # maintain the rollups of the changed tables
+        for rollup in list(self._rollups.values()):
+            if rollup.source in changed:
+                self._update_rollup(ctx, rollup)
+        return changed
+
+    def _update_rollup(self, ctx: pl.SQLContext, rollup: OpenArkRollup) -> None:
+        try:
+            rollup.update()
+        except Exception as e:
+            logging.warn(f'Failed to update rollup {rollup.name}: {e}')
+
+        version = rollup.version()
+        if version is None or self._delta_versions.get(rollup.name) == version:
+            return
+        ctx.register(name=rollup.name, frame=rollup.to_delta_polars(version))
+        self._delta_versions[rollup.name] = version
+
+    def _register_pending_models(self, ctx: pl.SQLContext, query: str) -> None:
+        tables = _find_referenced_tables(query, self._models_pending)
+        if not tables:
+            return
+
+        models = self._select_models({
+            table: self._models_pending.pop(table)
+            for table in tables
+        })
+        self._models.update(models)
+        self._refresh_delta_ctx(ctx, list(models.values()))
+
+    def _select_models(
+        self,
+        candidates: dict[str, list[tuple['OpenArkModel', str]]],
+    ) -> dict[str, 'OpenArkModel']:
+        # check the tables concurrently, falling back to the next bindings
+        selected = {}
+        remaining = {
+            table: list(bindings)
+            for (table, bindings) in candidates.items()
+            if bindings
+        }
+        while remaining:
+            heads = [bindings.pop(0) for bindings in remaining.values()]
+            checks = self._map(lambda item: _check_model_init(*item), heads)
+            for (table, (model, _), check_init) in zip(list(remaining), heads, checks):
+                if check_init:
+                    selected[table] = model
+                if check_init or not remaining[table]:
+                    del remaining[table]
+        return selected
 
 
 class OpenArkModel:
@@ -88,8 +501,16 @@ class OpenArkModel:
         self, /,
         name: str,
         version: int | None = None,
+        cache: OpenArkPayloadCache | None = None,
+        content_index: OpenArkContentIndex | None = None,
+        index_dir: str | None = None,
+        inline_threshold: int = 0,
+        mirror_dir: str | None = None,
+        pack_threshold: int = 0,
         storage_options: Dict[str, str] | None = None,
+        sessions: OpenArkSessionPool | None = None,
         timestamp: str | None = None,
+        upload_semaphore: OpenArkLoopSemaphore | None = None,
         user_name: str | None = None,
     ) -> None:
         if 'AWS_ENDPOINT_URL' in storage_options:
@@ -105,11 +526,27 @@ class OpenArkModel:
         self._table_uri = f's3a://{name}/metadata/'
         self._storage_options = storage_options
         self._timestamp = (timestamp or get_timestamp()).replace(':', '-')
+        self._upload_semaphore = upload_semaphore
         self._user_name = user_name or 'openark-py'
         self._version = version
 
         self._endpoint = urlparse(self._storage_options['AWS_ENDPOINT_URL'])
+        self._cache = cache
+        self._content_index = content_index
+        self._index: OpenArkKeyIndex | None = None
+        self._index_dir = index_dir
+        self._inline_threshold = inline_threshold
+        self._pack_threshold = pack_threshold
         self._minio: minio.Minio | None = None
+        self._mirror = None if mirror_dir is None else OpenArkDeltaMirror(
+            model=self,
+            path=os.path.join(mirror_dir, name),
+        )
+        self._sessions = sessions or OpenArkSessionPool.from_env()
+        self._sessions_owned = sessions is None
+
+        self.last_aggregate_source: str | None = None
+        self.last_scan_stats: dict[str, Any] | None = None
 
     @classmethod
     def load_object_storage(
@@ -117,6 +554,10 @@ class OpenArkModel:
         namespace: str,
         model_name: str,
         data: dict[str, Any],
+        index_dir: str | None = None,
+        mirror_dir: str | None = None,
+        secrets: dict[str, Any] | None = None,
+        sessions: OpenArkSessionPool | None = None,
     ) -> 'OpenArkModel':
         # parse account secret ref
         if 'borrowed' in data:
@@ -131,11 +572,11 @@ class OpenArkModel:
             }
 
         # load account secret
-        api = kube.client.CoreV1Api()
-        secret = api.read_namespaced_secret(
-            name=secret_ref['name'],
-            namespace=namespace,
-        )
+        secret = None if secrets is None else secrets.get(secret_ref['name'])
+        if secret is None:
+            secret = _read_secret(namespace, secret_ref['name'])
+            if secrets is not None:
+                secrets[secret_ref['name']] = secret
 
         def decode_secret(key: str) -> str:
             return base64.standard_b64decode(
@@ -152,19 +593,252 @@ class OpenArkModel:
         # create model
         return OpenArkModel(
             name=model_name,
+            index_dir=index_dir,
+            mirror_dir=mirror_dir,
+            sessions=sessions,
             storage_options=storage_options,
         )
 
-    async def get_payload(self, payload: dict[str, Any]) -> bytes:
-        async with aiohttp.ClientSession() as session:
-            return await self._get(
-                session=session,
+    def add_index(
+        self,
+        columns: list[str],
+        false_positive_rate: float = 0.01,
+        path: str | None = None,
+    ) -> OpenArkKeyIndex:
+        self._index = OpenArkKeyIndex(
+            model=self,
+            path=path or os.path.join(
+                self._index_dir or _DEFAULT_INDEX_DIR, self._name,
+            ),
+            columns=columns,
+            false_positive_rate=false_positive_rate,
+        )
+        self._index.update(self._load_delta_latest())
+        return self._index
+
+    def aggregate(
+        self,
+        aggregates: list[Aggregate],
+        filters: list[Filter] | None = None,
+        version: int | None = None,
+    ) -> pl.DataFrame:
+        table = self._load_delta(version=version)
+        filters = filters or []
+
+        # answer from the Delta log stats if possible
+        result = aggregate_from_stats(table, aggregates, filters)
+        if result is not None:
+            self.last_aggregate_source = 'metadata'
+            return pl.DataFrame([result])
+
+        self.last_aggregate_source = 'scan'
+        return self.scan(filters=filters, version=table.version()) \
+            .select(aggregates_to_exprs(aggregates)) \
+            .collect()
+
+    def approximate(
+        self,
+        aggregates: list[Aggregate],
+        filters: list[Filter] | None = None,
+        **kwargs: Any,
+    ) -> pl.DataFrame:
+        estimate = None
+        for estimate in self.iter_approximate(aggregates, filters, **kwargs):
+            pass
+        return estimate
+
+    async def close(self) -> None:
+        if self._sessions_owned:
+            await self._sessions.close()
+
+    async def download_to(
+        self,
+        payload: dict[str, Any],
+        path: str,
+        *,
+        parallel: int = 1,
+        part_size: int = _DEFAULT_PART_SIZE,
+    ) -> int:
+        # fetch large objects with parallel ranged GETs
+        if parallel > 1 and payload['storage'] == 'S3':
+            size = await self._stat_size(payload)
+            with open(path, 'wb') as f:
+                f.truncate(size)
+
+                async def write_part(offset: int, data: bytes) -> None:
+                    f.seek(offset)
+                    f.write(data)
+
+                await self._get_parts(
+                    payload=payload,
+                    size=size,
+                    parallel=parallel,
+                    part_size=part_size,
+                    callback=write_part,
+                )
+            return size
+
+        # stream the object into the file chunk by chunk
+        size = 0
+        with open(path, 'wb') as f:
+            async for chunk in self.iter_payload(payload):
+                f.write(chunk)
+                size += len(chunk)
+        return size
+
+    async def get_payload(
+        self,
+        payload: dict[str, Any],
+        *,
+        parallel: int = 1,
+        part_size: int = _DEFAULT_PART_SIZE,
+    ) -> bytes:
+        # fetch large objects with parallel ranged GETs
+        if parallel > 1 and payload['storage'] == 'S3':
+            size = await self._stat_size(payload)
+            buffer = bytearray(size)
+
+            async def write_part(offset: int, data: bytes) -> None:
+                buffer[offset:offset + len(data)] = data
+
+            await self._get_parts(
                 payload=payload,
+                size=size,
+                parallel=parallel,
+                part_size=part_size,
+                callback=write_part,
             )
+            return bytes(buffer)
+
+        return await self._get(payload)
+
+    async def get_payload_range(
+        self,
+        payload: dict[str, Any],
+        offset: int,
+        length: int | None = None,
+    ) -> bytes:
+        storage_type = payload['storage']
+        match storage_type:
+            case 'Passthrough' | None:
+                end = None if length is None else offset + length
+                return _load_passthrough(payload)[offset:end]
+            case 'S3':
+                return await self._get_minio(
+                    payload=payload,
+                    offset=offset,
+                    length=length,
+                )
+            case 'S3Packed':
+                offset, length = _get_packed_range(payload, offset, length)
+                if length == 0:
+                    return b''
+                return await self._get_minio(
+                    payload=payload,
+                    offset=offset,
+                    length=length,
+                )
+            case _:
+                raise ValueError(
+                    f'Unsupported OpenARK storage type: {storage_type}')
+
+    def compact(
+        self,
+        target_size: int | None = None,
+        partition_filters: list[Filter] | None = None,
+    ) -> dict[str, Any]:
+        return self._load_delta_latest().optimize.compact(
+            partition_filters=partition_filters,
+            target_size=target_size,
+        )
+
+    def get_payload_cache_stats(self) -> dict[str, Any] | None:
+        if self._cache is None:
+            return None
+        return self._cache.stats()
 
     def get_payload_url(self, payload: dict[str, Any]) -> str:
         return f'{self._endpoint.geturl()}/{payload["model"]}/{payload["path"]}'
 
+    def iter_approximate(
+        self,
+        aggregates: list[Aggregate],
+        filters: list[Filter] | None = None,
+        fraction: float = 0.1,
+        time_budget: float | None = None,
+        confidence: float = 0.95,
+        seed: int | None = None,
+        version: int | None = None,
+    ) -> Iterator[pl.DataFrame]:
+        return iter_estimates(
+            table=self._load_delta(version=version),
+            aggregates=aggregates,
+            filters=filters,
+            fraction=fraction,
+            time_budget=time_budget,
+            confidence=confidence,
+            seed=seed,
+        )
+
+    async def iter_payload(
+        self,
+        payload: dict[str, Any],
+        *,
+        offset: int = 0,
+        length: int | None = None,
+        chunk_size: int = _DEFAULT_CHUNK_SIZE,
+    ) -> AsyncIterator[bytes]:
+        storage_type = payload['storage']
+        match storage_type:
+            case 'Passthrough' | None:
+                value = _load_passthrough(payload)
+                end = len(value) if length is None else offset + length
+                for start in range(offset, end, chunk_size):
+                    yield value[start:min(start + chunk_size, end)]
+            case 'S3' | 'S3Packed':
+                if storage_type == 'S3Packed':
+                    offset, length = _get_packed_range(
+                        payload, offset, length,
+                    )
+                    if length == 0:
+                        return
+                response = await self._open_minio(
+                    payload=payload,
+                    offset=offset,
+                    length=length,
+                )
+                async with response:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        yield chunk
+            case _:
+                raise ValueError(
+                    f'Unsupported OpenARK storage type: {storage_type}')
+
+    def _load_delta(
+        self,
+        version: int | None = None,
+        as_of: datetime.datetime | str | None = None,
+    ) -> dl.DeltaTable:
+        if version is not None and as_of is not None:
+            raise ValueError('Only one of "version" and "as_of" can be given')
+
+        table = dl.DeltaTable(
+            table_uri=self._table_uri,
+            storage_options=self._storage_options,
+            version=self._version if version is None and as_of is None
+            else version,
+        )
+        if as_of is not None:
+            table.load_as_version(as_of)
+        return table
+
+    def _load_delta_latest(self) -> dl.DeltaTable:
+        # NOTE: the maintenance always applies to the latest version
+        return dl.DeltaTable(
+            table_uri=self._table_uri,
+            storage_options=self._storage_options,
+        )
+
     def _load_minio_client(self) -> minio.Minio:
         if self._minio is None:
             self._minio = minio.Minio(
@@ -180,97 +854,406 @@ class OpenArkModel:
         self,
         value: Any = {},
         payloads: dict[str, Payload] = {},
+        encoder: str | None = None,
     ) -> dict[str, Any]:
         if not isinstance(value, dict):
             value = {
                 'value': value,
             }
 
-        payloads_dumped = await asyncio.gather(*(
-            self._put(key, value)
+        payloads_raw = {
+            key: _dump_payload(value)
             for key, value in payloads.items()
-        ))
+        }
+
+        # pack many small payloads into a single object
+        payloads_packed = {
+            key: data
+            for key, data in payloads_raw.items()
+            if self._inline_threshold <= len(data) < self._pack_threshold
+        }
+        if len(payloads_packed) < 2:
+            payloads_packed = {}
+
+        async def dump_payload(key: str, data: bytes) -> dict[str, Any]:
+            if len(data) < self._inline_threshold:
+                return _dump_passthrough(key, data, encoder)
+            return await self._put(key, data)
+
+        pack_dumped, *payloads_dumped = await asyncio.gather(
+            self._put_pack(payloads_packed),
+            *(
+                dump_payload(key, data)
+                for key, data in payloads_raw.items()
+                if key not in payloads_packed
+            ),
+        )
+        payloads_dumped = {
+            payload['key']: payload
+            for payload in [*pack_dumped, *payloads_dumped]
+        }
 
         return {
             '__timestamp': get_timestamp(),
-            '__payloads': payloads_dumped,
+            '__payloads': [payloads_dumped[key] for key in payloads_raw],
             **value,
         }
 
-    async def _get(
-        self,
-        payload: dict[str, Any],
-        session: aiohttp.ClientSession | None = None,
-    ) -> bytes:
+    async def _get(self, payload: dict[str, Any]) -> bytes:
         storage_type = payload['storage']
         match storage_type:
             case 'Passthrough' | None:
-                return payload['value']
+                return _load_passthrough(payload)
             case 'S3':
-                return await self._get_minio(
-                    payload=payload,
-                    session=session,
+                if self._cache is None:
+                    return await self._get_minio(payload)
+                return await self._cache.get(
+                    model=payload['model'],
+                    path=payload['path'],
+                    etag=payload.get('etag'),
+                    fetch=lambda: self._fetch_minio(payload),
+                    validate=lambda: self._stat_etag(payload),
                 )
+            case 'S3Packed':
+                return await self.get_payload_range(payload, 0)
             case _:
                 raise ValueError(
                     f'Unsupported OpenARK storage type: {storage_type}')
 
+    async def _get_many(self, payloads: list[dict[str, Any]]) -> list[bytes]:
+        # fetch a pack only once if many of its payloads are requested
+        pack_counts = Counter(
+            (payload['model'], payload['path'])
+            for payload in payloads
+            if payload['storage'] == 'S3Packed'
+        )
+        packs: dict[tuple[str, str], asyncio.Future] = {}
+
+        async def get(payload: dict[str, Any]) -> bytes:
+            pack_key = (payload.get('model'), payload.get('path'))
+            if payload['storage'] != 'S3Packed' or pack_counts[pack_key] < 2:
+                return await self._get(payload)
+
+            if pack_key not in packs:
+                packs[pack_key] = asyncio.ensure_future(self._get({
+                    **payload,
+                    'storage': 'S3',
+                }))
+            pack = await packs[pack_key]
+            return pack[payload['offset']:payload['offset'] + payload['length']]
+
+        return await asyncio.gather(*(
+            get(payload)
+            for payload in payloads
+        ))
+
     async def _get_minio(
         self,
         payload: dict[str, Any],
-        session: aiohttp.ClientSession | None = None,
+        offset: int = 0,
+        length: int | None = None,
     ) -> Optional[bytes]:
-        model = payload['model']
-        path = payload['path']
-
         # check data
-        if model is None or path is None:
+        if payload['model'] is None or payload['path'] is None:
             return payload
 
-        client = self._load_minio_client()
+        response = await self._open_minio(
+            payload=payload,
+            offset=offset,
+            length=length,
+        )
+        async with response:
+            return await response.content.read()
+
+    async def _fetch_minio(self, payload: dict[str, Any]) -> tuple[str | None, bytes]:
+        response = await self._open_minio(payload)
+        async with response:
+            return (
+                response.headers.get('ETag'),
+                await response.content.read(),
+            )
+
+    async def _get_parts(
+        self,
+        payload: dict[str, Any],
+        size: int,
+        parallel: int,
+        part_size: int,
+        callback: Callable[[int, bytes], Coroutine[Any, Any, None]],
+    ) -> None:
+        semaphore = asyncio.Semaphore(parallel)
+
+        async def get_part(offset: int) -> None:
+            async with semaphore:
+                data = await self._get_minio(
+                    payload=payload,
+                    offset=offset,
+                    length=min(part_size, size - offset),
+                )
+                await callback(offset, data)
 
-        session_is_entered = session is None
-        if session_is_entered:
-            session = await aiohttp.ClientSession().__aenter__()
+        await asyncio.gather(*(
+            get_part(offset)
+            for offset in range(0, size, part_size)
+        ))
 
-        response = await client.get_object(
+    async def _open_minio(
+        self,
+        payload: dict[str, Any],
+        offset: int = 0,
+        length: int | None = None,
+    ) -> aiohttp.ClientResponse:
+        client = self._load_minio_client()
+        return await client.get_object(
             bucket_name=payload['model'],
             object_name=payload['path'],
-            session=session,
+            session=self._sessions.get(self._endpoint.geturl()),
+            offset=offset,
+            length=length or 0,
         )
-        content = await response.content.read()
-
-        if session_is_entered:
-            await session.__aexit__()
-        return content
 
     async def _put(
         self,
         key: str,
-        value: Payload,
+        data: bytes,
     ) -> dict[str, Any]:
         client = self._load_minio_client()
 
-        if isinstance(value, bytes):
-            data = value
-        else:
-            data = json.dumps(value).encode('utf-8')
+        if self._content_index is not None:
+            return await self._put_content_addressed(key, data)
 
         raw_key = f'payloads/{self._user_name}/{self._timestamp}/{key}'
-        response = await client.put_object(
-            bucket_name=self._name,
-            object_name=raw_key,
-            data=io.BytesIO(data),
-            length=len(data),
-        )
+        async with self._upload_slot():
+            response = await client.put_object(
+                bucket_name=self._name,
+                object_name=raw_key,
+                data=io.BytesIO(data),
+                length=len(data),
+            )
 
         return {
+            'etag': response.etag,
             'key': key,
             'model': self._name,
             'path': response.object_name,
             'storage': 'S3',
         }
 
+    async def _put_pack(self, payloads: dict[str, bytes]) -> list[dict[str, Any]]:
+        if not payloads:
+            return []
+
+        pack = await self._put(
+            key=f'{uuid.uuid4().hex}.pack',
+            data=b''.join(payloads.values()),
+        )
+        pack.pop('hash', None)
+
+        # index the payloads by their byte ranges in the pack
+        payloads_dumped = []
+        offset = 0
+        for key, data in payloads.items():
+            payloads_dumped.append({
+                **pack,
+                'key': key,
+                'length': len(data),
+                'offset': offset,
+                'storage': 'S3Packed',
+            })
+            offset += len(data)
+        return payloads_dumped
+
+    async def _put_content_addressed(
+        self,
+        key: str,
+        data: bytes,
+    ) -> dict[str, Any]:
+        client = self._load_minio_client()
+
+        digest = hashlib.sha256(data).hexdigest()
+        raw_key = f'payloads/sha256/{digest[:2]}/{digest}'
+        index_key = (self._name, digest)
+
+        # test whether the same content is already stored
+        etag = self._content_index.get(index_key)
+        if etag is None:
+            try:
+                stat = await client.stat_object(
+                    bucket_name=self._name,
+                    object_name=raw_key,
+                )
+                etag = stat.etag
+            except S3Error as e:
+                if e.code not in ('NoSuchKey', 'ResourceNotFound'):
+                    raise
+
+        # upload the content only if missing
+        if etag is None:
+            async with self._upload_slot():
+                response = await client.put_object(
+                    bucket_name=self._name,
+                    object_name=raw_key,
+                    data=io.BytesIO(data),
+                    length=len(data),
+                )
+            etag = response.etag
+        self._content_index.put(index_key, etag, 1)
+
+        return {
+            'etag': etag,
+            'hash': f'sha256:{digest}',
+            'key': key,
+            'model': self._name,
+            'path': raw_key,
+            'storage': 'S3',
+        }
+
+    def _upload_slot(self) -> contextlib.AbstractAsyncContextManager:
+        if self._upload_semaphore is None:
+            return contextlib.nullcontext()
+        return self._upload_semaphore.get()
+
+    async def _stat_etag(self, payload: dict[str, Any]) -> str | None:
+        client = self._load_minio_client()
+        stat = await client.stat_object(
+            bucket_name=payload['model'],
+            object_name=payload['path'],
+        )
+        return stat.etag
+
+    async def _stat_size(self, payload: dict[str, Any]) -> int:
+        client = self._load_minio_client()
+        stat = await client.stat_object(
+            bucket_name=payload['model'],
+            object_name=payload['path'],
+        )
+        return stat.size
+
+    def scan(
+        self,
+        columns: list[str] | None = None,
+        filters: list[Filter] | None = None,
+        version: int | None = None,
+        as_of: datetime.datetime | str | None = None,
+    ) -> pl.LazyFrame:
+        table = self._load_delta(version=version, as_of=as_of)
+        filters = filters or []
+
+        lf = self._scan_files(table, filters)
+        expr = filters_to_expr(filters)
+        if expr is not None:
+            lf = lf.filter(expr)
+        if columns is not None:
+            lf = lf.select(columns)
+        return lf
+
+    def _scan_files(
+        self,
+        table: dl.DeltaTable,
+        filters: list[Filter],
+    ) -> pl.LazyFrame:
+        # skip the files by the partition values and the min/max stats
+        actions = pl.from_arrow(get_add_actions(table))
+        kept = prune_files(actions, get_arrow_schema(table), filters)
+
+        # and then by the key index, if any
+        indexed = kept
+        if self._index is not None:
+            try:
+                self._index.update(table)
+                indexed = self._index.prune(kept, filters)
+            except Exception as e:
+                logging.warn(f'Failed to use the key index of {self._name}: {e}')
+        self.last_scan_stats = {
+            'version': table.version(),
+            'files_total': actions.height,
+            'files_scanned': indexed.height,
+            'files_skipped': actions.height - indexed.height,
+            'files_skipped_by_index': kept.height - indexed.height,
+            'bytes_total': int(actions['size_bytes'].sum()),
+            'bytes_scanned': int(indexed['size_bytes'].sum()),
+            'bytes_skipped': int(
+                actions['size_bytes'].sum() - indexed['size_bytes'].sum(),
+            ),
+        }
+
+        try:
+            dataset = table.to_pyarrow_dataset()
+        except dl.exceptions.DeltaProtocolError:
+            # e.g. deletion vectors; let the delta reader prune the files
+            return pl.scan_delta(
+                source=self._table_uri,
+                version=table.version(),
+                storage_options=self._storage_options,
+            )
+
+        paths = set(indexed['path'].to_list())
+        return pl.scan_pyarrow_dataset(pads.FileSystemDataset(
+            [
+                fragment
+                for fragment in dataset.get_fragments()
+                if fragment.path in paths
+            ],
+            schema=dataset.schema,
+            format=dataset.format,
+            filesystem=dataset.filesystem,
+        ))
+
+    async def tail(
+        self,
+        *,
+        start_version: int | None = None,
+        poll_interval: float = 1.0,
+    ) -> AsyncIterator[pl.DataFrame]:
+        table = await asyncio.to_thread(
+            dl.DeltaTable,
+            table_uri=self._table_uri,
+            storage_options=self._storage_options,
+        )
+        fs, root = load_filesystem(self._table_uri, self._storage_options)
+
+        # follow the new versions only, unless the start is given
+        version = table.version() if start_version is None \
+            else start_version - 1
+        while True:
+            await asyncio.to_thread(table.update_incremental)
+            latest = table.version()
+            if latest <= version:
+                await asyncio.sleep(poll_interval)
+                continue
+
+            for next_version in range(version + 1, latest + 1):
+                rows = await asyncio.to_thread(
+                    read_added_rows, table, fs, root, next_version, next_version,
+                )
+                version = next_version
+                if not rows.is_empty():
+                    yield rows
+
+    def vacuum(
+        self,
+        retention_hours: int | None = None,
+        dry_run: bool = False,
+        enforce_retention: bool = True,
+    ) -> list[str]:
+        return self._load_delta_latest().vacuum(
+            retention_hours=retention_hours,
+            dry_run=dry_run,
+            enforce_retention_duration=enforce_retention,
+        )
+
+    def z_order(
+        self,
+        columns: list[str],
+        target_size: int | None = None,
+        partition_filters: list[Filter] | None = None,
+    ) -> dict[str, Any]:
+        return self._load_delta_latest().optimize.z_order(
+            columns=columns,
+            partition_filters=partition_filters,
+            target_size=target_size,
+        )
+
     def to_delta(self) -> dl.DeltaTable:
         return dl.DeltaTable(
             table_uri=self._table_uri,
@@ -278,12 +1261,30 @@ class OpenArkModel:
             version=self._version,
         )
 
-    def to_delta_polars(self) -> pl.LazyFrame:
+    def to_delta_polars(self, version: int | None = None) -> pl.LazyFrame:
+        if version is None:
+            version = self._version
+
+        # read the local mirror if it can serve the requested version
+        if self._mirror is not None:
+            mirror_version = self._mirror.sync()
+            if version is None or version == mirror_version:
+                return pl.scan_delta(source=self._mirror.path)
+
         return pl.scan_delta(
             source=self._table_uri,
+            version=version,
             storage_options=self._storage_options,
         )
 
+    @property
+    def index(self) -> OpenArkKeyIndex | None:
+        return self._index
+
+    @property
+    def mirror(self) -> OpenArkDeltaMirror | None:
+        return self._mirror
+
     def to_lancedb(
         self,
         read_consistency_interval: Optional[datetime.timedelta] = datetime.timedelta(
@@ -305,6 +1306,51 @@ class OpenArkModel:
         return conn.open_table('metadata')
 
 
+class OpenArkPayload(dict[str, Any]):
+    def __init__(self, model: OpenArkModel, payload: dict[str, Any]) -> None:
+        super().__init__(payload)
+        self._model = model
+        self._task: asyncio.Task | None = None
+
+    def __await__(self):
+        return self.load().__await__()
+
+    def load(self) -> asyncio.Task:
+        if self._task is None:
+            type(self).load_all([self])
+        return self._task
+
+    @staticmethod
+    def load_all(payloads: list['OpenArkPayload']) -> None:
+        payloads = [
+            payload
+            for payload in payloads
+            if payload._task is None
+        ]
+        if not payloads:
+            return
+
+        # share the same fetch to reuse the packed objects
+        model = payloads[0]._model
+        values = asyncio.ensure_future(model._get_many([
+            dict(payload)
+            for payload in payloads
+        ]))
+
+        async def load(payload: OpenArkPayload, index: int) -> bytes:
+            value = (await values)[index]
+            payload['value'] = value
+            return value
+
+        for index, payload in enumerate(payloads):
+            payload._task = asyncio.ensure_future(load(payload, index))
+
+    @property
+    def loaded(self) -> bool:
+        return self._task is not None and self._task.done() \
+            and not self._task.cancelled() and self._task.exception() is None
+
+
 class OpenArkModelChannel:
     def __init__(
         self, /,
@@ -312,13 +1358,30 @@ class OpenArkModelChannel:
         messenger: Messenger,
         model: OpenArkModel,
         queued: bool,
+        lazy_payloads: bool = False,
+        max_pending: int = 0,
+        ordered: bool = True,
+        prefetch: int = 0,
+        spool: OpenArkSpool | None = None,
     ) -> None:
         self._encoder = encoder
+        self._lazy_payloads = lazy_payloads
         self._messenger = messenger
         self._model = model
+        self._ordered = ordered
+        self._prefetch = prefetch
+        self._prefetch_queue: asyncio.Queue | None = None
+        self._prefetch_task: asyncio.Task | None = None
+        self._publish_pending: set[asyncio.Future] = set()
+        self._publish_semaphore = asyncio.Semaphore(max_pending) \
+            if max_pending > 0 \
+            else None
+        self._publish_tail: asyncio.Future | None = None
         self._queued = queued
         self._reply: str | None = None
         self._service_timeout_sec: float | None = 10.0
+        self._spool = spool
+        self._spool_task: asyncio.Task | None = None
 
         self._publisher = self._messenger.publisher(
             topic=self.name,
@@ -342,13 +1405,26 @@ class OpenArkModelChannel:
                 f'Subscribing is not supported on this messenger type'
             )
 
-        while True:
-            data = await self._subscriber.__anext__()
-            message = codec.loads(data)
-            if message is None:
-                continue
+        # take the messages being prefetched in the background
+        if self._prefetch > 0:
+            if self._prefetch_task is None:
+                self._prefetch_queue = asyncio.Queue(maxsize=self._prefetch)
+                self._prefetch_task = asyncio.ensure_future(
+                    self._prefetch_loop(),
+                )
+            message = await self._prefetch_queue.get()
+            if isinstance(message, BaseException):
+                self._prefetch_task = None
+                raise message
+            if self._lazy_payloads:
+                return message
             return await self._load_payloads(message)
 
+        message = await self._next_message()
+        if self._lazy_payloads:
+            return self._wrap_payloads(message)
+        return await self._load_payloads(message)
+
     async def __call__(
         self,
         value: Any = {},
@@ -361,70 +1437,289 @@ class OpenArkModelChannel:
         message = await self._model._build_message(
             value=value,
             payloads=payloads,
+            encoder=self._encoder,
         )
         data = await self._service(
             data=codec.dumps(message, codec=self._encoder),
         )
         message = codec.loads(data)
 
-        if load_payloads:
-            return await self._load_payloads(message)
-        else:
+        if not load_payloads:
             return message
+        elif self._lazy_payloads:
+            return self._wrap_payloads(message)
+        else:
+            return await self._load_payloads(message)
 
     async def _load_payloads(self, message: dict[str, Any]) -> dict[str, Any]:
         if message['__payloads']:
-            async with aiohttp.ClientSession() as session:
-                async def load_payload(payload): return {
-                    **payload,
-                    'value': await self._model._get(
-                        session=session,
-                        payload=payload,
-                    ),
-                }
-                message['__payloads'] = await asyncio.gather(*(
-                    load_payload(payload)
-                    for payload in message['__payloads']
-                ))
+            payloads = self._wrap_payloads(message)['__payloads']
+            OpenArkPayload.load_all(payloads)
+            await asyncio.gather(*(
+                payload.load()
+                for payload in payloads
+            ))
+            message['__payloads'] = [
+                dict(payload)
+                for payload in payloads
+            ]
+        return message
+
+    async def _next_message(self) -> dict[str, Any]:
+        while True:
+            data = await self._subscriber.__anext__()
+            message = codec.loads(data)
+            if message is None:
+                continue
+            return message
+
+    async def _prefetch_loop(self) -> None:
+        try:
+            while True:
+                message = self._wrap_payloads(await self._next_message())
+                OpenArkPayload.load_all(message['__payloads'])
+                await self._prefetch_queue.put(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._prefetch_queue.put(e)
+
+    def _wrap_payloads(self, message: dict[str, Any]) -> dict[str, Any]:
+        message['__payloads'] = [
+            payload
+            if isinstance(payload, OpenArkPayload)
+            else OpenArkPayload(self._model, payload)
+            for payload in message.get('__payloads') or []
+        ]
         return message
 
     def __enter__(self) -> 'OpenArkModelChannel':
         return self
 
     def __exit__(self, exc_type, exc_value, traceback) -> None:
-        pass
+        self.close()
+
+    def close(self) -> None:
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+            self._prefetch_task = None
+            self._prefetch_queue = None
+        if self._spool_task is not None:
+            self._spool_task.cancel()
+            self._spool_task = None
+        if self._spool is not None:
+            self._spool.close()
+
+    def download_to(
+        self,
+        payload: dict[str, Any],
+        path: str,
+        *,
+        parallel: int = 1,
+    ) -> Coroutine[Any, Any, int]:
+        return self._model.download_to(payload, path, parallel=parallel)
 
-    def get_payload(self, payload: dict[str, Any]) -> Coroutine[Any, Any, bytes]:
-        return self._model.get_payload(payload)
+    def get_payload(
+        self,
+        payload: dict[str, Any],
+        *,
+        parallel: int = 1,
+    ) -> Coroutine[Any, Any, bytes]:
+        return self._model.get_payload(payload, parallel=parallel)
+
+    def get_payload_range(
+        self,
+        payload: dict[str, Any],
+        offset: int,
+        length: int | None = None,
+    ) -> Coroutine[Any, Any, bytes]:
+        return self._model.get_payload_range(payload, offset, length)
 
     def get_payload_url(self, payload: dict[str, Any]) -> str:
         return self._model.get_payload_url(payload)
 
+    def iter_payload(
+        self,
+        payload: dict[str, Any],
+        *,
+        offset: int = 0,
+        length: int | None = None,
+    ) -> AsyncIterator[bytes]:
+        return self._model.iter_payload(payload, offset=offset, length=length)
+
     async def publish(
         self,
         value: Any = {},
         payloads: dict[str, Payload] = {},
     ) -> dict[str, Any]:
+        if self._publish_pending:
+            future = await self.publish_nowait(
+                value=value,
+                payloads=payloads,
+            )
+            return await future
+
         if self._publisher is None:
             raise Exception(
                 f'Publishing is not supported on this messenger type'
             )
 
-        message = await self._model._build_message(
-            value=value,
-            payloads=payloads,
-        )
-        await self._publisher(
-            data=codec.dumps(message, codec=self._encoder),
-        )
-        return message
+        # publish directly, marking the order for the following messages
+        future = asyncio.get_running_loop().create_future()
+        self._publish_pending.add(future)
+        if self._ordered:
+            self._publish_tail = future
+        try:
+            message = await self._model._build_message(
+                value=value,
+                payloads=payloads,
+                encoder=self._encoder,
+            )
+            await self._publish_data(codec.dumps(message, codec=self._encoder))
+            return message
+        finally:
+            future.set_result(None)
+            self._publish_pending.discard(future)
+
+    async def publish_nowait(
+        self,
+        value: Any = {},
+        payloads: dict[str, Payload] = {},
+    ) -> asyncio.Future:
+        if self._publisher is None:
+            raise Exception(
+                f'Publishing is not supported on this messenger type'
+            )
+
+        # bound the messages being uploaded
+        if self._publish_semaphore is not None:
+            await self._publish_semaphore.acquire()
+
+        previous = self._publish_tail
+
+        async def publish() -> dict[str, Any]:
+            message = await self._model._build_message(
+                value=value,
+                payloads=payloads,
+                encoder=self._encoder,
+            )
+
+            # keep the order of the submitted messages
+            if previous is not None and not previous.done():
+                await asyncio.wait([previous])
+
+            await self._publish_data(
+                codec.dumps(message, codec=self._encoder),
+            )
+            return message
+
+        future = asyncio.ensure_future(publish())
+        if self._publish_semaphore is not None:
+            # NOTE: released even if the task is cancelled before it starts
+            future.add_done_callback(
+                lambda _: self._publish_semaphore.release(),
+            )
+        self._publish_pending.add(future)
+        future.add_done_callback(self._publish_pending.discard)
+        if self._ordered:
+            self._publish_tail = future
+        return future
+
+    async def _drain_spool(self) -> None:
+        while not self._spool.empty:
+            if not self._messenger.is_connected():
+                await asyncio.sleep(_SPOOL_RETRY_INTERVAL)
+                continue
+
+            try:
+                await self._spool.drain(self._publisher)
+            except Exception as e:
+                logging.warn(f'Failed to drain the spool of {self.name}: {e}')
+                await asyncio.sleep(_SPOOL_RETRY_INTERVAL)
+
+    async def _publish_data(self, data: bytes | bytearray) -> None:
+        if self._spool is None:
+            await self._publisher(data=data)
+        else:
+            await self._publish_spooled(data)
+
+    async def _publish_spooled(self, data: bytes | bytearray) -> None:
+        # keep the order while the spooled messages are being drained
+        if self._spool.empty and self._messenger.is_connected():
+            try:
+                return await self._publisher(data=data)
+            except Exception as e:
+                logging.warn(f'Failed to publish {self.name}; spooling: {e}')
+
+        if not self._spool.append(data):
+            logging.warn(f'Spool is full; dropped a message: {self.name}')
+        if self._spool_task is None or self._spool_task.done():
+            self._spool_task = asyncio.ensure_future(self._drain_spool())
+
+    async def flush(self) -> None:
+        if self._publish_pending:
+            await asyncio.wait(self._publish_pending)
+        if self._spool_task is not None:
+            await self._spool_task
 
     @property
     def name(self) -> str:
         return self._model._name
 
+    @property
+    def publisher(self) -> Publisher | None:
+        return self._publisher
 
-def _load_models(kube: kube.client.CustomObjectsApi, namespace: str) -> list[tuple[OpenArkModel, str]]:
+    @property
+    def spool(self) -> OpenArkSpool | None:
+        return self._spool
+
+    @property
+    def subscriber(self) -> Subscriber | None:
+        return self._subscriber
+
+
+class _Periodic:
+    def __init__(
+        self,
+        name: str,
+        interval: float,
+        target: Callable[[], Any],
+    ) -> None:
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._target = target
+        self._thread = threading.Thread(
+            name=name,
+            target=self._loop,
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive() and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _loop(self) -> None:
+        while not self._stopped.wait(self._interval):
+            try:
+                self._target()
+            except Exception as e:
+                logging.warn(f'Failed to run {self._thread.name}: {e}')
+
+
+def _load_models(
+    kube: kube.client.CustomObjectsApi,
+    namespace: str,
+    max_workers: int = 8,
+    mirror_dir: str | None = None,
+    index_dir: str | None = None,
+    sessions: OpenArkSessionPool | None = None,
+) -> list[tuple[OpenArkModel, str]]:
     bindings = kube.list_namespaced_custom_object(
         group='dash.ulagbulag.io',
         plural='modelstoragebindings',
@@ -432,7 +1727,7 @@ def _load_models(kube: kube.client.CustomObjectsApi, namespace: str) -> list[tup
         namespace=namespace,
     )['items']
 
-    models = []
+    targets = []
     unique_keys = set()
     for binding in bindings:
         model_name: str = binding['spec']['model']
@@ -459,13 +1754,237 @@ def _load_models(kube: kube.client.CustomObjectsApi, namespace: str) -> list[tup
             )
             continue
 
-        model = OpenArkModel.load_object_storage(
-            namespace=namespace,
-            model_name=model_name,
-            data=object_storage,
+        targets.append((model_name, storage_name, object_storage))
+
+    # read each account secret only once, concurrently
+    secret_names = {
+        object_storage['secretRef']['name']
+        if 'borrowed' in object_storage
+        else 'object-storage-user-0'
+        for (_, _, object_storage) in targets
+    }
+    secrets: dict[str, Any] = {}
+    if secret_names:
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(secret_names)),
+        ) as executor:
+            secrets.update(zip(
+                secret_names,
+                executor.map(
+                    lambda name: _read_secret(namespace, name),
+                    secret_names,
+                ),
+            ))
+
+    return [
+        (
+            OpenArkModel.load_object_storage(
+                namespace=namespace,
+                model_name=model_name,
+                data=object_storage,
+                index_dir=index_dir,
+                mirror_dir=mirror_dir,
+                secrets=secrets,
+                sessions=sessions,
+            ),
+            storage_name,
+        )
+        for (model_name, storage_name, object_storage) in targets
+    ]
+
+
+def _maintain_model(
+    model: OpenArkModel,
+    benchmark_query: str | None,
+    min_small_files: int,
+    retention_hours: int | None,
+    small_file_size: int,
+    target_size: int | None,
+    vacuum: bool,
+    z_order: list[str] | None,
+) -> dict[str, Any] | None:
+    table = model._load_delta_latest()
+    before = get_file_stats(table, small_file_size)
+
+    # skip the tables which are healthy enough
+    if before['small_files'] < min_small_files:
+        # NOTE: a table is z-ordered at least once, if requested
+        if z_order is None or _count_commits_since_optimize(table) is not None:
+            return None
+    elif z_order is not None and _count_commits_since_optimize(table) == 0:
+        return None
+
+    report: dict[str, Any] = {
+        'table': model._table_name,
+        **{f'{key}_before': value for (key, value) in before.items()},
+    }
+    if benchmark_query is not None:
+        report['query_sec_before'] = _benchmark_model(model, benchmark_query)
+
+    if z_order is not None:
+        report['z_order'] = model.z_order(z_order, target_size=target_size)
+    else:
+        report['compact'] = model.compact(target_size=target_size)
+    if vacuum:
+        report['vacuumed_files'] = len(
+            model.vacuum(retention_hours=retention_hours),
+        )
+
+    after = get_file_stats(model._load_delta_latest(), small_file_size)
+    report.update({f'{key}_after': value for (key, value) in after.items()})
+    if benchmark_query is not None:
+        report['query_sec_after'] = _benchmark_model(model, benchmark_query)
+        if report['query_sec_after'] > 0:
+            report['speedup'] = report['query_sec_before'] / \
+                report['query_sec_after']
+
+    logging.info(
+        f'Maintained model {model._name}: '
+        f'{before["files"]} -> {after["files"]} files'
+    )
+    return report
+
+
+def _count_commits_since_optimize(table: dl.DeltaTable) -> int | None:
+    commits = 0
+    for commit in table.history(limit=_MAINTENANCE_HISTORY_LIMIT):
+        operation = commit.get('operation', '')
+        if operation == 'OPTIMIZE':
+            return commits
+        if not operation.startswith('VACUUM'):
+            commits += 1
+    return None
+
+
+def _benchmark_model(model: OpenArkModel, query: str) -> float:
+    ctx = pl.SQLContext()
+    ctx.register(name=model._table_name, frame=model.to_delta_polars(
+        version=model._load_delta_latest().version(),
+    ))
+
+    started = time.perf_counter()
+    ctx.execute(query.format(table=model._table_name)).collect()
+    return time.perf_counter() - started
+
+
+def _check_model_init(model: OpenArkModel, storage_name: str) -> bool:
+    try:
+        check_init = model.to_delta().version() > 0
+    except dl.exceptions.TableNotFoundError:
+        check_init = False
+    if not check_init:
+        logging.warn(
+            f'Model {model._name} is not inited yet on {storage_name}; skipping...'
         )
-        models.append((model, storage_name))
-    return models
+        return False
+
+    logging.info(f'Loading model: {model._name}')
+    return True
+
+
+def _find_referenced_tables(query: str, tables: Iterable[str]) -> list[str]:
+    tokens = {
+        token.strip('"`').lower()
+        for token in re.findall(r'"[^"]+"|`[^`]+`|[A-Za-z_][A-Za-z0-9_]*', query)
+    }
+    return [table for table in tables if table.lower() in tokens]
+
+
+def _iter_lazy_batches(
+    lf: pl.LazyFrame,
+    batch_size: int,
+    arrow: bool,
+    spill_dir: str | None,
+) -> Iterator[pl.DataFrame | pa.RecordBatch]:
+    # NOTE: the streaming engine spills the results to disk, not to memory
+    fd, path = tempfile.mkstemp(
+        prefix='openark-query-', suffix='.parquet', dir=spill_dir,
+    )
+    os.close(fd)
+    try:
+        _sink_lazy(lf, path, 'parquet', row_group_size=batch_size)
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield batch if arrow else pl.from_arrow(batch)
+    finally:
+        os.remove(path)
+
+
+def _sink_lazy(
+    lf: pl.LazyFrame,
+    path: str,
+    format: str | None,
+    row_group_size: int | None = None,
+) -> None:
+    if format is None:
+        format = os.path.splitext(path)[1].lstrip('.').lower() or 'parquet'
+    match format:
+        case 'csv':
+            sink, write, kwargs = 'sink_csv', 'write_csv', {}
+        case 'parquet':
+            sink, write, kwargs = 'sink_parquet', 'write_parquet', {
+                'row_group_size': row_group_size,
+            }
+        case _:
+            raise ValueError(f'Unsupported sink format: {format}')
+
+    try:
+        getattr(lf, sink)(path, **kwargs)
+    except pl.exceptions.InvalidOperationError as e:
+        # e.g. the older streaming engines cannot run every plan
+        logging.warn(f'Falling back to the in-memory engine: {e}')
+        getattr(lf.collect(), write)(path, **kwargs)
+
+
+def _read_secret(namespace: str, name: str) -> Any:
+    api = kube.client.CoreV1Api()
+    return api.read_namespaced_secret(
+        name=name,
+        namespace=namespace,
+    )
+
+
+def _dump_passthrough(
+    key: str,
+    data: bytes,
+    encoder: str | None,
+) -> dict[str, Any]:
+    # text codecs cannot carry raw bytes
+    if encoder is not None and codec.is_binary(encoder):
+        return {
+            'key': key,
+            'storage': 'Passthrough',
+            'value': data,
+        }
+    return {
+        'encoding': 'base64',
+        'key': key,
+        'storage': 'Passthrough',
+        'value': base64.standard_b64encode(data).decode('ascii'),
+    }
+
+
+def _dump_payload(value: Payload) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return json.dumps(value).encode('utf-8')
+
+
+def _load_passthrough(payload: dict[str, Any]) -> bytes:
+    value = payload['value']
+    if payload.get('encoding') == 'base64' and isinstance(value, str):
+        return base64.standard_b64decode(value)
+    return value
+
+
+def _get_packed_range(
+    payload: dict[str, Any],
+    offset: int,
+    length: int | None,
+) -> tuple[int, int]:
+    remaining = max(payload['length'] - offset, 0)
+    if length is None or length > remaining:
+        length = remaining
+    return payload['offset'] + offset, length
 
 
 def _get_storage_target(storage: dict[str, Any]) -> Any:
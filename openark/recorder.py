@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any
+
+from openark import codec
+from openark.messenger import Publisher, Subscriber
+from openark.metrics import summarize_latencies
+from openark.model import OpenArkModelChannel, _dump_passthrough
+from openark.segment import SegmentWriter, iter_segment, list_segments, segment_path
+
+_METADATA_FILENAME = 'metadata.json'
+
+
+class OpenArkRecorder:
+    def __init__(
+        self, /,
+        source: OpenArkModelChannel | Subscriber,
+        path: str,
+        include_payloads: bool = False,
+        segment_size: int = 64 << 20,
+    ) -> None:
+        if isinstance(source, OpenArkModelChannel):
+            self._channel = source
+            self._subscriber = source.subscriber
+        else:
+            self._channel = None
+            self._subscriber = source
+        if self._subscriber is None:
+            raise Exception(
+                f'Subscribing is not supported on this messenger type'
+            )
+        if include_payloads and self._channel is None:
+            raise ValueError('Recording payloads requires a model channel')
+
+        self._include_payloads = include_payloads
+        self._path = path
+        self._writer = SegmentWriter(
+            path=self._path,
+            segment_size=segment_size,
+        )
+
+        with open(os.path.join(self._path, _METADATA_FILENAME), 'w') as f:
+            json.dump({
+                'include_payloads': self._include_payloads,
+                'model': None if self._channel is None else self._channel.name,
+            }, f)
+
+    async def record(
+        self,
+        count: int | None = None,
+        duration: float | None = None,
+    ) -> int:
+        deadline = None if duration is None else time.monotonic() + duration
+
+        recorded = 0
+        while count is None or recorded < count:
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+            try:
+                data = await asyncio.wait_for(
+                    self._subscriber.__anext__(),
+                    timeout=timeout,
+                )
+            except asyncio.TimeoutError:
+                break
+            timestamp_ns = time.time_ns()
+
+            if self._include_payloads:
+                data = await self._inline_payloads(data)
+                if data is None:
+                    continue
+
+            self._writer.append(data, timestamp_ns=timestamp_ns)
+            recorded += 1
+        return recorded
+
+    def close(self) -> None:
+        self._writer.close()
+
+    async def _inline_payloads(self, data: bytes) -> bytes | None:
+        encoder = codec.infer(data)
+        message = codec.loads(data)
+        if message is None:
+            return None
+
+        # embed the payload bytes so that the recording is self-contained
+        payloads = message.get('__payloads') or []
+        if payloads:
+            values = await self._channel._model._get_many(payloads)
+            message['__payloads'] = [
+                _dump_passthrough(payload['key'], value, encoder)
+                for payload, value in zip(payloads, values)
+            ]
+        return codec.dumps(message, codec=encoder)
+
+
+class OpenArkReplayer:
+    def __init__(self, /, path: str) -> None:
+        self._path = path
+
+        metadata_path = os.path.join(self._path, _METADATA_FILENAME)
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                self._metadata = json.load(f)
+        else:
+            self._metadata = {}
+
+    async def replay(
+        self,
+        target: OpenArkModelChannel | Publisher,
+        speed: float | None = 1.0,
+    ) -> dict[str, Any]:
+        if isinstance(target, OpenArkModelChannel):
+            publisher = target.publisher
+        else:
+            publisher = target
+        if publisher is None:
+            raise Exception(
+                f'Publishing is not supported on this messenger type'
+            )
+
+        latencies = []
+        lags = []
+        total_bytes = 0
+        first_timestamp_ns = None
+
+        started = time.perf_counter()
+        for seq in list_segments(self._path):
+            for (_, timestamp_ns, data) in iter_segment(segment_path(self._path, seq)):
+                # follow the recorded rate, scaled by the given speed
+                if first_timestamp_ns is None:
+                    first_timestamp_ns = timestamp_ns
+                if speed is not None:
+                    scheduled = started + \
+                        (timestamp_ns - first_timestamp_ns) / 1e9 / speed
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    lags.append(max(time.perf_counter() - scheduled, 0.0))
+
+                sent = time.perf_counter()
+                await publisher(data)
+                latencies.append(time.perf_counter() - sent)
+                total_bytes += len(data)
+        elapsed = time.perf_counter() - started
+
+        return {
+            'messages': len(latencies),
+            'bytes': total_bytes,
+            'elapsed_sec': elapsed,
+            'throughput_msgs_per_sec': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'throughput_bytes_per_sec': total_bytes / elapsed if elapsed > 0 else 0.0,
+            **summarize_latencies(latencies),
+            **summarize_latencies(lags, prefix='lag'),
+        }
@@ -0,0 +1,425 @@
+import logging
+import re
+from typing import TYPE_CHECKING, Any
+
+import deltalake as dl
+import polars as pl
+
+from openark.delta import get_commit_options, has_data_removals, load_filesystem, read_added_rows
+
+if TYPE_CHECKING:
+    from openark.model import OpenArkModel
+
+_PARTIALS = ['sum', 'count', 'min', 'max']
+
+_SQL_AGGREGATE = re.compile(
+    r'(sum|count|min|max|avg)\s*\(\s*("?\w+"?|\*)\s*\)',
+    re.IGNORECASE,
+)
+_SQL_ALIAS = re.compile(r'(.+?)(?:\s+as\s+"?(\w+)"?)?', re.IGNORECASE | re.DOTALL)
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_SQL_SHAPE = re.compile(
+    r'\s*select\s+(.+?)\s+from\s+"?(\w+)"?'
+    r'(?:\s+where\s+(.+?))?'
+    r'(?:\s+group\s+by\s+(.+?))?'
+    r'(?:\s+order\s+by\s+(.+?))?'
+    r'(?:\s+limit\s+(\d+))?'
+    r'\s*;?\s*',
+    re.IGNORECASE | re.DOTALL,
+)
+_SQL_UNSAFE = re.compile(
+    r'\b(?:distinct|except|filter|having|intersect|join|over|qualify|union|within)\b',
+    re.IGNORECASE,
+)
+_SQL_WHERE_KEYWORDS = {
+    'and', 'between', 'false', 'ilike', 'in', 'is', 'like', 'not', 'null', 'or', 'true',
+}
+_SQL_ORDER_KEYWORDS = {'asc', 'desc', 'first', 'last', 'nulls'}
+
+# the resolution of the time expressions, in seconds
+_DAY = 86400
+_DATE_PARTS = {
+    'second': 1, 'minute': 60, 'hour': 3600,
+    'day': _DAY, 'dow': _DAY, 'doy': _DAY, 'isodow': _DAY, 'isoweek': _DAY,
+    'isoyear': _DAY, 'month': _DAY, 'quarter': _DAY, 'week': _DAY, 'year': _DAY,
+}
+_STRFTIME_DIRECTIVES = {
+    'S': 1, 'T': 1, 'c': 1, 'X': 1,
+    'M': 60, 'R': 60,
+    'H': 3600, 'I': 3600, 'k': 3600, 'l': 3600, 'p': 3600, 'P': 3600,
+    'a': _DAY, 'A': _DAY, 'b': _DAY, 'B': _DAY, 'C': _DAY, 'd': _DAY,
+    'D': _DAY, 'e': _DAY, 'F': _DAY, 'G': _DAY, 'g': _DAY, 'h': _DAY,
+    'j': _DAY, 'm': _DAY, 'u': _DAY, 'U': _DAY, 'V': _DAY, 'w': _DAY,
+    'W': _DAY, 'x': _DAY, 'y': _DAY, 'Y': _DAY, '%': None,
+}
+_EVERY_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': _DAY}
+
+
+class OpenArkRollup:
+    def __init__(
+        self, /,
+        model: 'OpenArkModel',
+        name: str,
+        columns: list[str],
+        every: str = '1m',
+        group_by: list[str] | None = None,
+        time_column: str = '__timestamp',
+    ) -> None:
+        self._model = model
+        self._name = name
+        self._columns = columns
+        self._every = every
+        self._group_by = group_by or []
+        self._time_column = time_column
+
+        self._source_version: int | None = None
+
+        self._app_id = f'openark-rollup-{name}'
+        self._table_name = f'{model._table_name}_{name}'
+        self._table_uri = _get_rollup_uri(model._table_uri, name)
+
+    @property
+    def name(self) -> str:
+        return self._table_name
+
+    @property
+    def source(self) -> str:
+        return self._model._table_name
+
+    def to_delta_polars(self, version: int | None = None) -> pl.LazyFrame:
+        lf = pl.scan_delta(
+            source=self._table_uri,
+            version=version,
+            storage_options=self._model._storage_options,
+        )
+
+        # derive the averages from the partial aggregates
+        return lf.with_columns([
+            (pl.col(f'{column}_sum') / pl.col(f'{column}_count'))
+            .alias(f'{column}_avg')
+            for column in self._columns
+        ])
+
+    def version(self) -> int | None:
+        rollup = self._load_table()
+        return None if rollup is None else rollup.version()
+
+    def source_version(self) -> int | None:
+        return self._source_version
+
+    def rewrite(self, query: str, schema: pl.Schema) -> str | None:
+        # NOTE: the source rows must be bucketed exactly as the partials
+        every = _parse_every(self._every)
+        time_dtype = schema.get(self._time_column)
+        if every is None or not isinstance(time_dtype, pl.Datetime) \
+                or time_dtype.time_zone is not None:
+            return None
+
+        query, literals = _hide_literals(query)
+        if _SQL_UNSAFE.search(query) \
+                or len(re.findall(r'\bselect\b', query, re.IGNORECASE)) != 1:
+            return None
+        shape = _SQL_SHAPE.fullmatch(query)
+        if shape is None or shape.group(2).lower() != self.source.lower():
+            return None
+        items, _, where, group_by, order_by, limit = shape.groups()
+
+        # rewrite the selected items over the partials
+        aliases = set()
+        select = []
+        for (index, item) in enumerate(_split_items(items)):
+            expr, alias = _SQL_ALIAS.fullmatch(item).groups()
+            rewritten = self._rewrite_expr(expr, literals, every)
+            if rewritten is None:
+                return None
+            if alias is not None:
+                aliases.add(alias)
+            select.append(f'{rewritten} AS "{alias or f"__{index}"}"')
+
+        groups = []
+        for item in _split_items(group_by or ''):
+            if item.isdigit() or item.strip('"') in aliases:
+                groups.append(item)
+                continue
+            rewritten = self._rewrite_expr(item, literals, every)
+            if rewritten is None or _SQL_AGGREGATE.fullmatch(item.strip()):
+                return None
+            groups.append(rewritten)
+
+        # the filters and the order may refer to the keys only
+        if where is not None and not _refers_only(
+            where, set(self._group_by), _SQL_WHERE_KEYWORDS,
+        ):
+            return None
+        if order_by is not None and not _refers_only(
+            order_by, set(self._group_by) | aliases, _SQL_ORDER_KEYWORDS,
+        ):
+            return None
+
+        rewritten = f'SELECT {", ".join(select)} FROM "{self.name}"'
+        if where is not None:
+            rewritten += f' WHERE {where}'
+        if groups:
+            rewritten += f' GROUP BY {", ".join(groups)}'
+        if order_by is not None:
+            rewritten += f' ORDER BY {order_by}'
+        if limit is not None:
+            rewritten += f' LIMIT {limit}'
+        return _restore_literals(rewritten, literals)
+
+    def _rewrite_expr(
+        self,
+        expr: str,
+        literals: list[str],
+        every: int,
+    ) -> str | None:
+        expr = expr.strip()
+
+        # the aggregates are combined from the partials
+        matched = _SQL_AGGREGATE.fullmatch(expr)
+        if matched is not None:
+            func, column = matched.group(1).lower(), matched.group(2).strip('"')
+            if column == '*':
+                return 'SUM("rows")' if func == 'count' else None
+            if column not in self._columns:
+                return None
+            match func:
+                case 'avg':
+                    return f'SUM("{column}_sum") / NULLIF(SUM("{column}_count"), 0)'
+                case 'count':
+                    return f'SUM("{column}_count")'
+                case _:
+                    return f'{func.upper()}("{column}_{func}")'
+
+        if expr.strip('"') in self._group_by:
+            return expr
+
+        # a time expression no finer than the buckets reads the same on them
+        resolution = _get_time_resolution(expr, self._time_column, literals)
+        if resolution is None or resolution % every != 0:
+            return None
+        return re.sub(
+            rf'"?\b{re.escape(self._time_column)}\b"?', '"bucket"', expr,
+        )
+
+    def update(self) -> int:
+        self._source_version = None
+        source = dl.DeltaTable(
+            table_uri=self._model._table_uri,
+            storage_options=self._model._storage_options,
+        )
+        latest = source.version()
+
+        rollup = self._load_table()
+        applied = -1 if rollup is None else \
+            rollup.transaction_version(self._app_id)
+        applied = -1 if applied is None else applied
+        if applied >= latest:
+            self._source_version = applied
+            return 0
+
+        # the partial aggregates cannot take back the removed rows
+        fs, root = load_filesystem(
+            self._model._table_uri, self._model._storage_options,
+        )
+        rebuild = rollup is None or applied < 0 or \
+            has_data_removals(fs, root, applied + 1, latest)
+        if rebuild:
+            rows = self._model.to_delta_polars(version=latest)
+        else:
+            rows = read_added_rows(source, fs, root, applied + 1, latest).lazy()
+
+        partials = self._aggregate(rows)
+        options = get_commit_options(self._app_id, latest, {
+            'openark.rollup.name': self._name,
+            'openark.rollup.source_version': str(latest),
+        })
+        if rebuild:
+            logging.info(f'Rebuilding rollup: {self._table_name}')
+            dl.write_deltalake(
+                self._table_uri,
+                partials.to_arrow(),
+                mode='overwrite',
+                schema_mode='overwrite',
+                storage_options=self._model._storage_options,
+                **options,
+            )
+        else:
+            self._merge(rollup, partials, options)
+        self._source_version = latest
+        return partials.height
+
+    def _aggregate(self, rows: pl.LazyFrame) -> pl.DataFrame:
+        # NOTE: only the needed columns are read, batch by batch
+        rows = rows.select([self._time_column, *self._group_by, *self._columns])
+
+        time_column = pl.col(self._time_column)
+        if rows.collect_schema().get(self._time_column) == pl.String:
+            time_column = time_column.str.to_datetime()
+
+        exprs = [pl.len().cast(pl.Int64).alias('rows')]
+        for column in self._columns:
+            value = pl.col(column).cast(pl.Float64)
+            exprs += [
+                value.sum().alias(f'{column}_sum'),
+                value.count().cast(pl.Int64).alias(f'{column}_count'),
+                value.min().alias(f'{column}_min'),
+                value.max().alias(f'{column}_max'),
+            ]
+
+        return _collect_streaming(
+            rows
+            .with_columns(time_column.dt.truncate(self._every).alias('bucket'))
+            .group_by(['bucket', *self._group_by])
+            .agg(exprs)
+            .sort('bucket')
+        )
+
+    def _load_table(self) -> dl.DeltaTable | None:
+        try:
+            return dl.DeltaTable(
+                table_uri=self._table_uri,
+                storage_options=self._model._storage_options,
+            )
+        except dl.exceptions.TableNotFoundError:
+            return None
+
+    def _merge(
+        self,
+        rollup: dl.DeltaTable,
+        partials: pl.DataFrame,
+        options: dict[str, Any],
+    ) -> None:
+        # combine the partial aggregates of the existing buckets
+        updates = {'rows': 't."rows" + s."rows"'}
+        for column in self._columns:
+            sum_, count, min_, max_ = (
+                f'"{column}_{partial}"' for partial in _PARTIALS
+            )
+            updates.update({
+                sum_: f'COALESCE(t.{sum_}, 0) + COALESCE(s.{sum_}, 0)',
+                count: f't.{count} + s.{count}',
+                min_: f'CASE WHEN t.{min_} IS NULL OR s.{min_} < t.{min_} '
+                f'THEN s.{min_} ELSE t.{min_} END',
+                max_: f'CASE WHEN t.{max_} IS NULL OR s.{max_} > t.{max_} '
+                f'THEN s.{max_} ELSE t.{max_} END',
+            })
+
+        predicate = ' AND '.join(
+            f'(t."{key}" IS NOT DISTINCT FROM s."{key}")'
+            for key in ['bucket', *self._group_by]
+        )
+        rollup.merge(
+            source=partials.to_arrow(),
+            predicate=predicate,
+            source_alias='s',
+            target_alias='t',
+            **options,
+        ) \
+            .when_matched_update(updates=updates) \
+            .when_not_matched_insert_all() \
+            .execute()
+
+
+def _get_time_resolution(
+    expr: str,
+    time_column: str,
+    literals: list[str],
+) -> int | None:
+    column = rf'"?{re.escape(time_column)}"?'
+
+    if re.fullmatch(rf'{column}\s*::\s*date', expr, re.IGNORECASE) \
+            or re.fullmatch(rf'cast\s*\(\s*{column}\s+as\s+date\s*\)', expr, re.IGNORECASE):
+        return _DAY
+
+    matched = re.fullmatch(
+        rf'date_part\s*\(\s*\x00(\d+)\x00\s*,\s*{column}\s*\)', expr, re.IGNORECASE,
+    )
+    if matched is not None:
+        return _DATE_PARTS.get(literals[int(matched.group(1))].lower())
+    matched = re.fullmatch(
+        rf'extract\s*\(\s*(\w+)\s+from\s+{column}\s*\)', expr, re.IGNORECASE,
+    )
+    if matched is not None:
+        return _DATE_PARTS.get(matched.group(1).lower())
+
+    matched = re.fullmatch(
+        rf'strftime\s*\(\s*{column}\s*,\s*\x00(\d+)\x00\s*\)', expr, re.IGNORECASE,
+    )
+    if matched is not None:
+        resolutions = []
+        for directive in re.findall(r'%(.)', literals[int(matched.group(1))]):
+            if directive not in _STRFTIME_DIRECTIVES:
+                return None
+            if _STRFTIME_DIRECTIVES[directive] is not None:
+                resolutions.append(_STRFTIME_DIRECTIVES[directive])
+        return min(resolutions, default=None)
+    return None
+
+
+def _hide_literals(query: str) -> tuple[str, list[str]]:
+    literals = []
+
+    def hide(matched: re.Match) -> str:
+        literals.append(matched.group(0)[1:-1].replace("''", "'"))
+        return f'\x00{len(literals) - 1}\x00'
+
+    return _SQL_LITERAL.sub(hide, query), literals
+
+
+def _parse_every(every: str) -> int | None:
+    matched = re.fullmatch(r'(\d+)([smhd])', every)
+    if matched is None:
+        return None
+    return int(matched.group(1)) * _EVERY_UNITS[matched.group(2)]
+
+
+def _refers_only(clause: str, names: set[str], keywords: set[str]) -> bool:
+    for token in re.findall(r'"[^"]+"|\x00\d+\x00|[A-Za-z_]\w*', clause):
+        if token.startswith('\x00') or token.lower() in keywords:
+            continue
+        if token.strip('"') not in names:
+            return False
+    return True
+
+
+def _restore_literals(query: str, literals: list[str]) -> str:
+    return re.sub(
+        r'\x00(\d+)\x00',
+        lambda matched: "'{}'".format(literals[int(matched.group(1))].replace("'", "''")),
+        query,
+    )
+
+
+def _split_items(items: str) -> list[str]:
+    # split by the top-level commas
+    parts = []
+    depth = 0
+    start = 0
+    for (index, char) in enumerate(items):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(items[start:index].strip())
+            start = index + 1
+    if items.strip():
+        parts.append(items[start:].strip())
+    return parts
+
+
+def _collect_streaming(lf: pl.LazyFrame) -> pl.DataFrame:
+    try:
+        return lf.collect(engine='streaming')
+    except (TypeError, ValueError):
+        # the older polars have a separate streaming flag
+        return lf.collect(streaming=True)
+
+
+def _get_rollup_uri(table_uri: str, name: str) -> str:
+    # NOTE: the rollups are stored next to the model metadata
+    base = table_uri.rstrip('/')
+    if base.endswith('/metadata'):
+        base = base[:-len('/metadata')]
+    return f'{base}/rollups/{name}/'
@@ -0,0 +1,84 @@
+import mmap
+import os
+import struct
+import time
+from typing import Iterator
+
+# NOTE: Each record is prefixed with its timestamp (ns) and its length
+_HEADER = struct.Struct('<QI')
+_SEGMENT_SUFFIX = '.seg'
+
+
+class SegmentWriter:
+    def __init__(
+        self, /,
+        path: str,
+        segment_size: int = 64 << 20,
+    ) -> None:
+        self._path = path
+        self._segment_size = segment_size
+        os.makedirs(self._path, exist_ok=True)
+
+        # never append after a record torn by the last crash
+        segments = list_segments(self._path)
+        self._seq = segments[-1] + 1 if segments else 0
+        self._file = open(segment_path(self._path, self._seq), 'ab')
+
+    def append(self, data: bytes | bytearray, timestamp_ns: int | None = None) -> int:
+        if self._file.tell() >= self._segment_size:
+            self.roll()
+
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        self._file.write(_HEADER.pack(timestamp_ns, len(data)))
+        self._file.write(data)
+        self._file.flush()
+        return _HEADER.size + len(data)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def roll(self) -> None:
+        self._file.close()
+        self._seq += 1
+        self._file = open(segment_path(self._path, self._seq), 'ab')
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+
+def iter_segment(
+    path: str,
+    offset: int = 0,
+) -> Iterator[tuple[int, int, bytes]]:
+    # yields (next offset, timestamp in ns, data)
+    size = os.path.getsize(path)
+    if size <= offset:
+        return
+
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as m:
+        while offset + _HEADER.size <= size:
+            timestamp_ns, length = _HEADER.unpack_from(m, offset)
+            end = offset + _HEADER.size + length
+            if end > size:
+                # the record is not fully written yet
+                break
+            data = m[offset + _HEADER.size:end]
+            offset = end
+            yield offset, timestamp_ns, data
+
+
+def list_segments(path: str) -> list[int]:
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        int(name[:-len(_SEGMENT_SUFFIX)])
+        for name in os.listdir(path)
+        if name.endswith(_SEGMENT_SUFFIX)
+    )
+
+
+def segment_path(path: str, seq: int) -> str:
+    return os.path.join(path, f'{seq:020d}{_SEGMENT_SUFFIX}')
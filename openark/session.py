@@ -0,0 +1,105 @@
+import asyncio
+import os
+import weakref
+
+import aiohttp
+
+
+class OpenArkSessionPool:
+    def __init__(
+        self, /,
+        limit: int = 100,
+        limit_per_host: int = 32,
+        keepalive_timeout: float = 30.0,
+        ttl_dns_cache: int | None = 300,
+    ) -> None:
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._ttl_dns_cache = ttl_dns_cache
+
+        self._sessions: dict[str, tuple[asyncio.AbstractEventLoop, aiohttp.ClientSession]] = {}
+
+    @classmethod
+    def from_env(cls) -> 'OpenArkSessionPool':
+        ttl_dns_cache = int(os.environ.get('PIPE_HTTP_DNS_CACHE_TTL', '300'))
+        return cls(
+            limit=int(os.environ.get('PIPE_HTTP_LIMIT', '100')),
+            limit_per_host=int(
+                os.environ.get('PIPE_HTTP_LIMIT_PER_HOST', '32'),
+            ),
+            keepalive_timeout=float(
+                os.environ.get('PIPE_HTTP_KEEPALIVE_TIMEOUT', '30'),
+            ),
+            ttl_dns_cache=ttl_dns_cache if ttl_dns_cache > 0 else None,
+        )
+
+    def fork(self) -> 'OpenArkSessionPool':
+        return type(self)(
+            limit=self._limit,
+            limit_per_host=self._limit_per_host,
+            keepalive_timeout=self._keepalive_timeout,
+            ttl_dns_cache=self._ttl_dns_cache,
+        )
+
+    def get(self, endpoint: str) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+
+        # reuse the session if it is still alive on the current loop
+        if endpoint in self._sessions:
+            session_loop, session = self._sessions[endpoint]
+            if session_loop is loop and not session.closed:
+                return session
+            _close_session(session_loop, session)
+
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                keepalive_timeout=self._keepalive_timeout,
+                ttl_dns_cache=self._ttl_dns_cache,
+                use_dns_cache=self._ttl_dns_cache is not None,
+            ),
+        )
+        self._sessions[endpoint] = (loop, session)
+        return session
+
+    async def close(self) -> None:
+        sessions = self._sessions
+        self._sessions = {}
+
+        loop = asyncio.get_running_loop()
+        for (session_loop, session) in sessions.values():
+            if session_loop is loop and not session.closed:
+                await session.close()
+            else:
+                _close_session(session_loop, session)
+
+
+class OpenArkLoopSemaphore:
+    def __init__(self, value: int) -> None:
+        self._value = value
+        self._semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Semaphore,
+        ] = weakref.WeakKeyDictionary()
+
+    def get(self) -> asyncio.Semaphore:
+        # NOTE: an asyncio semaphore is bound to the first loop which waits on it
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self._value)
+        return semaphore
+
+
+def _close_session(
+    loop: asyncio.AbstractEventLoop,
+    session: aiohttp.ClientSession,
+) -> None:
+    if session.closed:
+        return
+
+    # NOTE: a session can be closed only on its own event loop; the
+    # connections of a finished loop have been gone together with it
+    if loop.is_running() and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(session.close(), loop)
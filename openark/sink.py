@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import time
+from typing import Any
+import uuid
+
+import deltalake as dl
+import pyarrow as pa
+
+from openark.delta import get_arrow_schema, get_commit_options
+from openark.model import OpenArkModel, OpenArkModelChannel
+
+_ROWS_PER_BATCH = 1024
+_PAYLOAD_VALUE_KEYS = ('encoding', 'value')
+_SEQ_METADATA_KEY = 'openark.sink.seq'
+_WRITER_METADATA_KEY = 'openark.sink.writer'
+_HISTORY_LIMIT = 1000
+
+
+class OpenArkDeltaSink:
+    def __init__(
+        self, /,
+        channel: OpenArkModelChannel,
+        max_rows: int = 100_000,
+        max_bytes: int = 64 << 20,
+        max_interval: float = 10.0,
+        partition_by: list[str] | None = None,
+        writer_id: str | None = None,
+    ) -> None:
+        self._channel = channel
+        self._model: OpenArkModel = channel._model
+        self._max_rows = max_rows
+        self._max_bytes = max_bytes
+        self._max_interval = max_interval
+        self._partition_by = partition_by
+        self._writer_id = writer_id or f'openark-sink-{uuid.uuid4()}'
+
+        self._batches: list[pa.RecordBatch] = []
+        self._bytes = 0
+        self._first_buffered_at: float | None = None
+        self._inflight: int | None = None
+        self._lock = asyncio.Lock()
+        self._rows: list[dict[str, Any]] = []
+        self._rows_buffered = 0
+        self._schema: pa.Schema | None = None
+        self._seq: int | None = None
+        self._timer: asyncio.Task | None = None
+
+        self._stats = {
+            'messages': 0,
+            'commits': 0,
+            'rows_committed': 0,
+            'bytes_committed': 0,
+            'skipped_commits': 0,
+            'rejected_rows': 0,
+            'errors': 0,
+        }
+
+    async def __aenter__(self) -> 'OpenArkDeltaSink':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    async def append(self, message: dict[str, Any]) -> None:
+        if self._timer is None:
+            self._timer = asyncio.ensure_future(self._flush_loop())
+        if self._first_buffered_at is None:
+            self._first_buffered_at = time.monotonic()
+
+        self._rows.append(message)
+        self._rows_buffered += 1
+        self._stats['messages'] += 1
+        if len(self._rows) >= _ROWS_PER_BATCH:
+            await self._seal_batch()
+
+        if self._rows_buffered >= self._max_rows \
+                or self._bytes >= self._max_bytes:
+            await self.flush()
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
+        await self.flush()
+
+    async def flush(self) -> int | None:
+        async with self._lock:
+            await self._seal_batch()
+            if not self._batches:
+                return None
+
+            # NOTE: the new messages are buffered while committing
+            batches, self._batches = self._batches, []
+            try:
+                version = await asyncio.to_thread(self._commit, batches)
+            except Exception as e:
+                # keep the batches to retry them on the next flush
+                self._batches = batches + self._batches
+                self._stats['errors'] += 1
+                logging.warn(
+                    f'Failed to commit the sink batches to {self._model._name}: {e}'
+                )
+                return None
+
+            self._bytes -= sum(batch.nbytes for batch in batches)
+            self._rows_buffered -= sum(batch.num_rows for batch in batches)
+            if not self._batches and not self._rows:
+                self._first_buffered_at = None
+            return version
+
+    async def run(self) -> None:
+        if self._channel.subscriber is None:
+            raise Exception(
+                f'Subscribing is not supported on this messenger type'
+            )
+
+        # NOTE: the payloads are stored by reference, never downloaded
+        try:
+            while True:
+                try:
+                    message = await self._channel._next_message()
+                except StopAsyncIteration:
+                    break
+                await self.append(_strip_payloads(message))
+        finally:
+            await self.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self._stats,
+            'buffered_rows': self._rows_buffered,
+            'buffered_bytes': self._bytes,
+            'seq': self._seq,
+            'writer_id': self._writer_id,
+        }
+
+    def _commit(self, batches: list[pa.RecordBatch]) -> int | None:
+        table = self._load_table()
+
+        # NOTE: the sequence is recovered from the table, not from memory
+        committed = -1 if table is None else self._load_committed_seq(table)
+        if self._seq is None:
+            self._seq = committed + 1
+        elif committed >= self._seq:
+            # the last commit has been applied even though it seemed failed
+            self._stats['skipped_commits'] += 1
+            self._seq = committed + 1
+
+            # NOTE: the newer batches are written under the next sequence
+            batches = batches[self._inflight or len(batches):]
+            self._inflight = None
+            if not batches:
+                return table.version()
+
+        # the leading batches which belong to the sequence being committed
+        self._inflight = len(batches)
+        data = pa.Table.from_batches(batches)
+        dl.write_deltalake(
+            table if table is not None else self._model._table_uri,
+            data,
+            mode='append',
+            partition_by=self._partition_by if table is None else None,
+            storage_options=self._model._storage_options,
+            **get_commit_options(self._writer_id, self._seq, {
+                _SEQ_METADATA_KEY: str(self._seq),
+                _WRITER_METADATA_KEY: self._writer_id,
+            }),
+        )
+
+        self._inflight = None
+        self._stats['commits'] += 1
+        self._stats['rows_committed'] += data.num_rows
+        self._stats['bytes_committed'] += data.nbytes
+        self._seq += 1
+
+        if table is None:
+            table = self._load_table()
+        else:
+            table.update_incremental()
+        return table.version()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._max_interval / 4)
+            if self._first_buffered_at is None:
+                continue
+            if time.monotonic() - self._first_buffered_at >= self._max_interval:
+                await self.flush()
+
+    def _load_committed_seq(self, table: dl.DeltaTable) -> int:
+        if hasattr(table, 'transaction_version'):
+            seq = table.transaction_version(self._writer_id)
+            return -1 if seq is None else seq
+
+        for commit in table.history(limit=_HISTORY_LIMIT):
+            if commit.get(_WRITER_METADATA_KEY) == self._writer_id:
+                return int(commit[_SEQ_METADATA_KEY])
+        return -1
+
+    def _load_table(self) -> dl.DeltaTable | None:
+        try:
+            table = dl.DeltaTable(
+                table_uri=self._model._table_uri,
+                storage_options=self._model._storage_options,
+            )
+        except dl.exceptions.TableNotFoundError:
+            return None
+
+        if self._schema is None:
+            self._schema = get_arrow_schema(table)
+        return table
+
+    async def _seal_batch(self) -> None:
+        if not self._rows:
+            return
+        if self._schema is None:
+            await asyncio.to_thread(self._load_table)
+
+        # NOTE: no awaits below, so that the rows are sealed only once
+        rows = self._rows
+        if self._schema is None:
+            # the first batch defines the schema of a new table
+            try:
+                self._schema = pa.RecordBatch.from_pylist(rows).schema
+            except (pa.ArrowException, TypeError, ValueError):
+                self._schema = pa.RecordBatch.from_pylist(rows[:1]).schema
+
+        batch = self._build_batch_or_reject(rows)
+        self._rows = self._rows[len(rows):]
+        if batch is not None:
+            self._append_batch(batch)
+
+    def _build_batch_or_reject(
+        self,
+        rows: list[dict[str, Any]],
+    ) -> pa.RecordBatch | None:
+        try:
+            return _build_batch(rows, self._schema)
+        except (pa.ArrowException, TypeError, ValueError):
+            pass
+
+        # drop only the rows which do not fit the schema
+        accepted = []
+        for row in rows:
+            try:
+                _build_batch([row], self._schema)
+            except (pa.ArrowException, TypeError, ValueError) as e:
+                self._rows_buffered -= 1
+                self._stats['rejected_rows'] += 1
+                logging.warn(
+                    f'Rejecting a sink row of {self._model._name}: {e}'
+                )
+                continue
+            accepted.append(row)
+
+        if not accepted:
+            return None
+        return _build_batch(accepted, self._schema)
+
+    def _append_batch(self, batch: pa.RecordBatch) -> None:
+        self._batches.append(batch)
+        self._bytes += batch.nbytes
+
+
+def _build_batch(rows: list[dict[str, Any]], schema: pa.Schema) -> pa.RecordBatch:
+    try:
+        return pa.RecordBatch.from_pylist(rows, schema=schema)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+
+    # convert the mismatched values (e.g. timestamp strings) column by column
+    inferred = pa.RecordBatch.from_pylist(rows)
+    columns = []
+    for field in schema:
+        if field.name in inferred.schema.names:
+            columns.append(inferred.column(field.name).cast(field.type))
+        else:
+            columns.append(pa.nulls(inferred.num_rows, field.type))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def _strip_payloads(message: dict[str, Any]) -> dict[str, Any]:
+    payloads = message.get('__payloads')
+    if payloads:
+        message['__payloads'] = [
+            {
+                key: value
+                for (key, value) in payload.items()
+                if key not in _PAYLOAD_VALUE_KEYS
+            }
+            for payload in payloads
+        ]
+    return message
@@ -0,0 +1,205 @@
+import asyncio
+import fcntl
+import logging
+import os
+from typing import IO, Any, Awaitable, Callable, Optional
+
+from openark.segment import SegmentWriter, iter_segment, list_segments, segment_path, _HEADER
+
+_CURSOR_FILENAME = 'cursor'
+_LOCK_FILENAME = 'lock'
+_CURSOR_SAVE_INTERVAL = 64  # in records
+
+
+class OpenArkSpool:
+    def __init__(
+        self, /,
+        path: str,
+        max_bytes: int = 1 << 30,
+        segment_size: int = 16 << 20,
+        drop_policy: str = 'oldest',
+        drain_rate: float | None = None,
+    ) -> None:
+        if drop_policy not in ('newest', 'oldest'):
+            raise ValueError(f'Unsupported spool drop policy: {drop_policy}')
+
+        # NOTE: each spool owns its directory exclusively
+        self._path, self._lock = _lock_spool_dir(path)
+        self._max_bytes = max_bytes
+        self._drop_policy = drop_policy
+        self._drain_rate = drain_rate
+        self._writer = SegmentWriter(
+            path=self._path,
+            segment_size=segment_size,
+        )
+
+        # restore the last drained position
+        self._cursor = self._load_cursor()
+        for seq in list_segments(self._path):
+            path = segment_path(self._path, seq)
+            if seq < self._cursor[0] or (
+                seq != self._writer.seq and os.path.getsize(path) == 0
+            ):
+                os.remove(path)
+        self._bytes = sum(
+            os.path.getsize(segment_path(self._path, seq))
+            for seq in list_segments(self._path)
+            if seq >= self._cursor[0]
+        ) - self._cursor[1]
+
+        self.dropped = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> Optional['OpenArkSpool']:
+        spool_dir = os.environ.get('PIPE_SPOOL_DIR') or None
+        if spool_dir is None:
+            return None
+
+        drain_rate = float(os.environ.get('PIPE_SPOOL_DRAIN_RATE', '0'))
+        return cls(
+            path=os.path.join(spool_dir, name),
+            max_bytes=int(
+                os.environ.get('PIPE_SPOOL_MAX_SIZE', str(1 << 30)),
+            ),
+            drop_policy=os.environ.get('PIPE_SPOOL_DROP_POLICY', 'oldest'),
+            drain_rate=drain_rate if drain_rate > 0 else None,
+        )
+
+    def append(self, data: bytes | bytearray) -> bool:
+        size = _HEADER.size + len(data)
+        if size > self._max_bytes:
+            self.dropped += 1
+            return False
+
+        # make room for the new record
+        while self._bytes + size > self._max_bytes:
+            if self._drop_policy == 'newest':
+                self.dropped += 1
+                return False
+            self._drop_oldest_segment()
+
+        self._bytes += self._writer.append(data)
+        return True
+
+    def close(self) -> None:
+        self._save_cursor()
+        self._writer.close()
+        self._lock.close()
+
+    async def drain(
+        self,
+        publish: Callable[[bytes], Awaitable[Any]],
+    ) -> int:
+        try:
+            return await self._drain(publish)
+        finally:
+            self._save_cursor()
+
+    async def _drain(
+        self,
+        publish: Callable[[bytes], Awaitable[Any]],
+    ) -> int:
+        count = 0
+        while not self.empty:
+            seq, offset = self._cursor
+
+            # drop the records of the deleted segments
+            path = segment_path(self._path, seq)
+            if not os.path.exists(path):
+                self._cursor = (seq + 1, 0)
+                continue
+
+            for (offset, _, data) in iter_segment(path, offset):
+                # NOTE: the cursor moves only after the record is published
+                await publish(data)
+                if self._cursor[0] != seq:
+                    # the segment has been dropped while publishing
+                    break
+                self._bytes -= _HEADER.size + len(data)
+                self._cursor = (seq, offset)
+
+                count += 1
+                if count % _CURSOR_SAVE_INTERVAL == 0:
+                    self._save_cursor()
+                if self._drain_rate is not None:
+                    await asyncio.sleep(1.0 / self._drain_rate)
+                else:
+                    await asyncio.sleep(0)
+
+            if self._cursor[0] != seq:
+                continue
+
+            # wait for the records appended while publishing
+            size = os.path.getsize(path)
+            if seq == self._writer.seq:
+                if offset < size:
+                    continue
+                self._writer.roll()
+
+            # release the drained segment, including any torn tail record
+            self._bytes -= size - offset
+            os.remove(path)
+            self._cursor = (seq + 1, 0)
+            self._save_cursor()
+        return count
+
+    @property
+    def empty(self) -> bool:
+        return self._bytes <= 0
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    def _drop_oldest_segment(self) -> None:
+        seq, offset = self._cursor
+        if seq == self._writer.seq:
+            self._writer.roll()
+
+        path = segment_path(self._path, seq)
+        if os.path.exists(path):
+            dropped = sum(1 for _ in iter_segment(path, offset))
+            self._bytes -= os.path.getsize(path) - offset
+            self.dropped += dropped
+            os.remove(path)
+            logging.warn(
+                f'Spool is full; dropped {dropped} oldest messages: {self._path}'
+            )
+
+        self._cursor = (seq + 1, 0)
+        self._save_cursor()
+
+    def _load_cursor(self) -> tuple[int, int]:
+        segments = list_segments(self._path)
+        cursor = (segments[0] if segments else 0, 0)
+
+        path = os.path.join(self._path, _CURSOR_FILENAME)
+        if os.path.exists(path):
+            with open(path) as f:
+                seq, offset = (int(token) for token in f.read().split())
+            cursor = max(cursor, (seq, offset))
+        return cursor
+
+    def _save_cursor(self) -> None:
+        path = os.path.join(self._path, _CURSOR_FILENAME)
+        path_tmp = f'{path}.tmp'
+        with open(path_tmp, 'w') as f:
+            f.write(f'{self._cursor[0]} {self._cursor[1]}')
+        os.replace(path_tmp, path)
+
+
+def _lock_spool_dir(path: str) -> tuple[str, IO]:
+    # take the next directory if another spool is using it
+    candidate = path
+    index = 0
+    while True:
+        os.makedirs(candidate, exist_ok=True)
+        lock = open(os.path.join(candidate, _LOCK_FILENAME), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            index += 1
+            candidate = f'{path}.{index}'
+            continue
+        return candidate, lock